@@ -1,7 +1,186 @@
 import requests
 import json
+import numpy as np
+import threading
+import asyncio
 from datetime import datetime
 import time
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# ----- Rate limiting ----- #
+# (requests per second, max burst) for each exchange
+# endpoints without their own entry share the exchange's "default" budget
+RATE_LIMITS = {
+    "binance":      {"default":(20, 40)},
+    "bitfinex":     {"default":(1, 10), "candles":(1/3, 1)},
+    "coinbasepro":  {"default":(3, 6)},
+    "gemini":       {"default":(2, 5)},
+    "okex":         {"default":(10, 20)},
+    }
+_limiters = {}      # (exchange, endpoint) -> RateLimiter
+_limiterLock = threading.Lock()
+
+class RateLimiter():
+# Token bucket that holds up to `capacity` requests and refills at `rate` requests per second
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.granted = 0            # number of requests let through
+        self.waited = 0             # total seconds callers spent waiting on this limiter
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def tryAcquire(self, tokens=1):
+        # take tokens without waiting
+        # returns 0 if they were granted, otherwise the seconds until they will be available
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                self.granted += 1
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        # block the calling thread until tokens are available
+        waited = 0
+        delay = self.tryAcquire(tokens)
+        while delay > 0:
+            time.sleep(delay)
+            waited += delay
+            delay = self.tryAcquire(tokens)
+        with self.lock:
+            self.waited += waited
+        return waited
+
+    async def acquireAsync(self, tokens=1):
+        # same as acquire, but yields to the event loop instead of blocking it
+        waited = 0
+        delay = self.tryAcquire(tokens)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = self.tryAcquire(tokens)
+        with self.lock:
+            self.waited += waited
+        return waited
+
+    def available(self, tokens=1):
+        with self.lock:
+            self._refill()
+            return self.tokens >= tokens
+
+    def timeUntil(self, tokens=1):
+        # seconds until tokens are available (0 if they are now), without taking them
+        with self.lock:
+            self._refill()
+            return max(0, (tokens - self.tokens) / self.rate)
+
+    def penalize(self, seconds):
+        # empty the bucket so no requests go out for the next few seconds
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def usage(self):
+        # fraction of the burst budget that is currently used up
+        with self.lock:
+            self._refill()
+            return min(1, max(0, 1 - self.tokens / self.capacity))
+
+def getLimiter(ex, endpoint="default"):
+    limits = RATE_LIMITS.get(ex, {})
+    if endpoint not in limits: endpoint = "default"
+    with _limiterLock:
+        if (ex, endpoint) not in _limiters:
+            rate, burst = limits.get(endpoint, (1, 1))
+            _limiters[(ex, endpoint)] = RateLimiter(rate, burst)
+        return _limiters[(ex, endpoint)]
+
+def requestDelay(ex, endpoint="default"):
+    # seconds until a request to this exchange's endpoint is allowed (0 if one is now)
+    return getLimiter(ex, endpoint).timeUntil()
+
+def rateLimitUsage():
+    # {(exchange, endpoint): {"used":fraction, "requests":n, "waited":seconds}}
+    with _limiterLock:
+        limiters = dict(_limiters)
+    return {key:{"used":lim.usage(), "requests":lim.granted, "waited":lim.waited} for key,lim in limiters.items()}
+
+# ----- HTTP session layer ----- #
+# One keep-alive session per exchange host so polls reuse an open connection
+# instead of doing a new TCP/TLS handshake on every request
+POOL_SIZE = 4       # max connections kept alive per host
+TIMEOUT = 5         # seconds to wait on connect/read before giving up on a request
+_sessions = {}      # host -> requests.Session
+_sessionLock = threading.Lock()
+
+def configureSessions(poolSize=None, timeout=None):
+    global POOL_SIZE
+    global TIMEOUT
+
+    if timeout != None: TIMEOUT = timeout
+    if poolSize != None and poolSize != POOL_SIZE:
+        POOL_SIZE = poolSize
+        # drop existing sessions so they get rebuilt with the new pool size
+        closeSessions()
+
+def getSession(url):
+    host = urlparse(url).netloc
+    with _sessionLock:
+        if host not in _sessions:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            sess.mount("https://", adapter)
+            sess.mount("http://", adapter)
+            _sessions[host] = sess
+        return _sessions[host]
+
+def httpGet(url, params=None, ex=None, endpoint="default"):
+    # wait for the exchange's rate limit before sending the request
+    limiter = None
+    if ex != None:
+        limiter = getLimiter(ex, endpoint)
+        limiter.acquire()
+
+    resp = getSession(url).get(url, params=params, timeout=TIMEOUT)
+
+    # got rate limited anyways, back off for as long as the exchange asks
+    if resp.status_code == 429 and limiter != None:
+        retry = resp.headers.get("Retry-After", "")
+        limiter.penalize(float(retry) if retry.isdigit() else 1 / limiter.rate)
+    return resp
+
+def closeSessions():
+    with _sessionLock:
+        for sess in _sessions.values():
+            sess.close()
+        _sessions.clear()
+
+def connectionStats():
+    # {host: {"requests":n, "new":n, "reused":n}} for every host a request has been sent to
+    stats = {}
+    with _sessionLock:
+        for host, sess in _sessions.items():
+            reqs = 0
+            new = 0
+            for adapter in set(sess.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    reqs += pool.num_requests
+                    new += pool.num_connections
+            stats[host] = {"requests":reqs, "new":new, "reused":max(0, reqs - new)}
+    return stats
 
 def getDailyVol(ex, COIN="BTC"):
     url = ""
@@ -29,7 +208,7 @@ def getDailyVol(ex, COIN="BTC"):
         url = "https://www.okex.com/api/spot/v3/instruments/%s-USDT/ticker" % COIN
 
     try:
-        resp = requests.get(url, params=params)
+        resp = httpGet(url, params=params, ex=ex, endpoint="stats")
     except:
         print("An error occured while try to communicate with %s" % ex)
         return None
@@ -40,16 +219,233 @@ def getDailyVol(ex, COIN="BTC"):
         
     return resp.json()
 
-def getCandle(ex, tint, COIN="BTC", lim=1, start=None, end=None):
-    url = ""
-    params=None
-    ret = None
+# ----- Candle normalization ----- #
+# Every exchange's candles get parsed into one typed array (new->old, except binance which is old->new)
+# Rows can still be indexed like the raw responses: [t, open, high, low, close, volume, taker buy volume]
+# taker buy volume is only provided by binance, it's NaN for every other exchange unless it was built from trades
+CANDLE_DTYPE = np.dtype([("t", np.int64), ("o", np.float64), ("h", np.float64), ("l", np.float64),
+                         ("c", np.float64), ("v", np.float64), ("buy", np.float64)])
+
+# which response columns hold [t, open, high, low, close, volume] for each exchange
+CANDLE_COLUMNS = {
+    "binance":      [0, 1, 2, 3, 4, 5],
+    "bitfinex":     [0, 1, 3, 4, 2, 5],   # [t ochl v]
+    "coinbasepro":  [0, 3, 2, 1, 4, 5],   # [t lhoc v]
+    "gemini":       [0, 1, 2, 3, 4, 5],
+    "okex":         [0, 1, 2, 3, 4, 5],
+    }
+
+def emptyCandles(n=0):
+    candles = np.zeros(n, dtype=CANDLE_DTYPE)
+    candles["buy"] = np.nan
+    return candles
 
+def flatCandle(t, price, n=1, gran=0):
+    # n candles with no trades at the given price, the first at time t and going back in time by gran
+    candles = emptyCandles(n)
+    candles["t"] = t - np.arange(n) * gran
+    for col in ("o", "h", "l", "c"):
+        candles[col] = price
+    return candles
+
+def normalizeCandles(ex, resp):
+    if len(resp) == 0:
+        return emptyCandles()
+
+    # parse the whole response at once (numbers sent as strings get converted too)
+    cols = CANDLE_COLUMNS[ex]
+    isISO = isinstance(resp[0][0], str)
+    raw = np.array(resp, dtype=str if isISO else np.float64)
+    candles = emptyCandles(len(raw))
+
+    # normalize to consistent timestamps (epoch seconds)
+    if isISO:
+        candles["t"] = np.char.rstrip(raw[:, 0], "Z").astype("datetime64[s]").astype(np.int64)
+    else:
+        ts = raw[:, 0].astype(np.int64)
+        candles["t"] = np.where(ts > 9999999999, ts // 1000, ts) # millisecond epoch
+
+    # normalize all response data to the same order
+    for col, idx in zip(("o", "h", "l", "c", "v"), cols[1:]):
+        candles[col] = raw[:, idx].astype(np.float64)
+    if ex == "binance" and raw.shape[1] >= 10:
+        candles["buy"] = raw[:, 9]
+    return candles
+
+# ----- Candle history pagination ----- #
+# max number of candles each exchange returns per request (exchanges not listed don't paginate)
+PAGE_SIZE = {"binance":1000, "coinbasepro":300, "okex":200}
+# seconds an exchange's newest candle can lag behind real time (coinbase only updates every 3-5 minutes)
+PAGE_LAG = {"coinbasepro":300}
+
+def intervalStart(t, gran):
+    # weeks start on Mon 00:00:00 UTC, epoch 0 was a Thursday
+    if gran == 604800:
+        return t - ((t - 4*86400) % gran)
+    return t - (t % gran)
+
+def _pageTime(ex, t):
+    if ex == "binance":
+        return int(t * 1000)
+    elif ex == "okex":
+        return datetime.utcfromtimestamp(t).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return datetime.utcfromtimestamp(t).isoformat()
+
+def planPages(ex, tint, lim, tnow=None):
+    # split a request for lim candles into [(start, end, limit)] pages, newest page first
+    # every page's time range is calculated up front so the pages can all be requested at once
+    size = PAGE_SIZE.get(ex)
+    if size == None or lim <= size:
+        return [(None, None, lim)]
+
+    gran = granFromInterv(tint)
+    if tnow == None: tnow = time.time()
+    newest = int(intervalStart(tnow, gran))
+    # ask for extra candles to cover any lag, they get trimmed off when the pages are merged
+    if ex in PAGE_LAG:
+        lim += int(PAGE_LAG[ex] / gran) + 1
+    pages = []
+    for first in range(0, lim, size):
+        n = min(size, lim - first)
+        endT = newest - first * gran
+        startT = endT - (n - 1) * gran
+        # okex treats end as exclusive
+        if ex == "okex": endT += gran
+        pages.append((_pageTime(ex, startT), _pageTime(ex, endT), n))
+    return pages
+
+def _mergePages(ex, pages, lim):
+    # combine pages in timestamp order, dropping any candles that overlap between pages
+    # (if pages overlap, the candle from the later page is kept)
+    merged = np.concatenate(pages)[::-1]
+    temp, first = np.unique(merged["t"], return_index=True)
+    ret = merged[first][::-1][:lim] # np.unique sorts old->new
+    if ex == "binance": ret = ret[::-1] # binance is old->new
+    return ret
+
+# ----- Resampling ----- #
+# longest candles that are still aligned to UTC (gemini is based on EST, okex on Hong Kong time)
+RESAMPLE_MAX_BASE = {"gemini":3600, "okex":14400}
+# most shorter candles combined into one (more than this and the exchange can't give enough history,
+# gemini doesn't paginate so it only ever returns one page of candles)
+RESAMPLE_MAX_RATIO = {"gemini":4}
+
+def baseInterval(ex, tint):
+    # the interval to request from the exchange: tint itself if the exchange has it,
+    # otherwise the longest interval it has that evenly divides tint (None if there isn't one)
+    if validInterval(ex, tint):
+        return tint
+    gran = granFromInterv(tint)
+    best = None
+    for interval in getIntervals(ex):
+        g = granFromInterv(interval)
+        if g >= gran or gran % g != 0 or g > RESAMPLE_MAX_BASE.get(ex, gran) or gran / g > RESAMPLE_MAX_RATIO.get(ex, 24):
+            continue
+        if best == None or g > granFromInterv(best):
+            best = interval
+    return best
+
+def resampleCandles(ex, base, gran):
+    # combine candles of a shorter interval into candles of gran (same order as the exchange's candles)
+    if base is None or len(base) == 0:
+        return base
+    # sort old->new and drop repeated timestamps (gemini repeats them during downtime)
+    temp, first = np.unique(base["t"], return_index=True)
+    base = base[first]
+    buckets = intervalStart(base["t"], gran)
+    # the oldest candle might not be complete if it doesn't start at the beginning of its interval
+    if base["t"][0] != buckets[0]:
+        keep = buckets != buckets[0]
+        base = base[keep]
+        buckets = buckets[keep]
+        if len(base) == 0: return emptyCandles()
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(base)] - 1
+    candles = emptyCandles(len(starts))
+    candles["t"] = buckets[starts]
+    candles["o"] = base["o"][starts]
+    candles["h"] = np.maximum.reduceat(base["h"], starts)
+    candles["l"] = np.minimum.reduceat(base["l"], starts)
+    candles["c"] = base["c"][ends]
+    candles["v"] = np.add.reduceat(base["v"], starts)
+    candles["buy"] = np.add.reduceat(base["buy"], starts)
+    return candles if ex == "binance" else candles[::-1]
+
+def _getCandleResampled(ex, tint, base, COIN, lim, cache):
+    # request enough of the shorter candles to build lim candles (plus one in case the oldest isn't complete)
+    k = granFromInterv(tint) // granFromInterv(base)
+    resp = getCandle(ex, base, COIN, (lim+1)*k, cache=cache)
+    if resp is None:
+        return None
+    candles = resampleCandles(ex, resp, granFromInterv(tint))
+    return candles[-lim:] if ex == "binance" else candles[:lim]
+
+def getCandle(ex, tint, COIN="BTC", lim=1, start=None, end=None, cache=None):
     ex = ex.lower()
 
     if not validInterval(ex, tint):
-        print("%s is not a valid interval for the %s api" % (tint, ex))
+        base = baseInterval(ex, tint)
+        if base == None or start != None or end != None:
+            print("%s is not a valid interval for the %s api" % (tint, ex))
+            return None
+        return _getCandleResampled(ex, tint, base, COIN, lim, cache)
+
+    if start != None or end != None:
+        return _getCandlePage(ex, tint, COIN, lim, start, end)
+
+    if cache != None:
+        return _getCandleCached(ex, tint, COIN, lim, cache)
+
+    pages = planPages(ex, tint, lim)
+    if len(pages) == 1:
+        return _getCandlePage(ex, tint, COIN, lim)
+
+    # request all pages concurrently, the rate limiter spaces them out as needed
+    futures = []
+    with ThreadPoolExecutor(max_workers=min(len(pages), POOL_SIZE)) as pool:
+        for startT, endT, n in pages:
+            futures.append(pool.submit(_getCandlePage, ex, tint, COIN, n, startT, endT))
+    results = [f.result() for f in futures]
+
+    # only keep pages up to the first failure so there aren't any gaps in the history
+    if results[0] is None:
+        return None
+    pages = []
+    for page in results:
+        if page is None:
+            break
+        pages.append(page)
+    return _mergePages(ex, pages, lim)
+
+def _getCandleCached(ex, tint, COIN, lim, cache):
+    # use whatever history is already cached and only request the candles newer than that
+    cached = cache.load(ex, COIN, tint, lim)
+    missing = lim
+    gran = granFromInterv(tint)
+    # rows left by an earlier run with a different history length can have gaps, only use them if they don't
+    if len(cached) >= lim and cached[0]["t"] - cached[lim-1]["t"] == (lim-1)*gran:
+        # the newest cached candle gets requested again since it may not have been closed when it was saved
+        missing = int((time.time() - cached[0][0]) / gran) + 2
+        if ex in PAGE_LAG:
+            missing += int(PAGE_LAG[ex] / gran) + 1
+
+    # cache doesn't go back far enough (or is too old to be useful), get the full history
+    if missing >= lim:
+        ret = getCandle(ex, tint, COIN, lim)
+        if ret is not None: cache.save(ex, COIN, tint, ret)
         return ret
+
+    resp = getCandle(ex, tint, COIN, missing)
+    if resp is None:
+        return None
+    cache.save(ex, COIN, tint, resp)
+    return _mergePages(ex, [cached, resp], lim)
+
+def _getCandlePage(ex, tint, COIN, lim, start=None, end=None):
+    url = ""
+    params=None
+    ret = None
     
     if ex == "binance":
         url = "https://api.binance.com/api/v1/klines"
@@ -91,7 +487,7 @@ def getCandle(ex, tint, COIN="BTC", lim=1, start=None, end=None):
 
     ts = time.strftime("%m/%d %H:%M:%S", time.localtime(time.time()))
     try:
-        resp = requests.get(url, params=params)
+        resp = httpGet(url, params=params, ex=ex, endpoint="candles")
     except:
         print("%s - An error occured while try to communicate with %s" % (ts, ex))
         return ret
@@ -100,51 +496,11 @@ def getCandle(ex, tint, COIN="BTC", lim=1, start=None, end=None):
         print("%s - Unable to retrieve data from %s (%d)" % (ts, ex, resp.status_code))
         return ret
     
-    # normalize to consistent timestamps
+    # exchanges that ignore the limit return new->old, so anything past lim isn't needed
     resp = resp.json()
-    oldestTS = resp[-1][0] if ex != "binance" else resp[0][0]
-    for entry in resp:
-        if isinstance(entry[0], str): # ISO format
-            dt = datetime.strptime(entry[0], "%Y-%m-%dT%H:%M:%S.%fZ")
-            entry[0] = int((dt - datetime(1970,1,1)).total_seconds())
-        elif entry[0] > 9999999999: # millisecond epoch
-                entry[0] = int(entry[0] / 1000)
-
-
-    # normalize all response data to the same order
-    # also paginate exchanges that provide limited data per request
-    if ex == "bitfinex":
-        # reorder to put close after low [t ochl v] -> [t ohlc v]
-        temp = resp    
-        ret = []
-        for x in temp:
-            ret.append([x[0], x[1], x[3], x[4], x[2], x[5]])
-        return ret
-    elif ex == "binance" and lim > 1000:
-        startT = oldestTS - granFromInterv(tint)*min((lim-999),1001)*1000
-        resp2 = getCandle(ex, tint, COIN=COIN, lim=lim-1000, start=startT, end=oldestTS)
-        resp = resp2 + resp # binance is in reverse order, so resp comes first
-    elif ex == "coinbasepro":
-        # reorder from [t lhoc v] -> [t ohlc v]
-        temp = resp
-        ret = []
-        for x in temp:
-            ret.append([x[0], x[3], x[2], x[1], x[4], x[5]])
-        if lim > 300:
-            # cbp rejects if start/end result in more than 300 candles
-            # calculate time range in ISO format
-            startT = datetime.utcfromtimestamp(oldestTS - granFromInterv(tint) * min(lim-299,301)).isoformat()
-            endT = datetime.utcfromtimestamp(oldestTS - granFromInterv(tint)).isoformat()
-            time.sleep(0.3) # make sure we don't get rate lmiited
-            resp2 = getCandle(ex, tint, COIN=COIN, lim=lim-300, start=startT, end=endT)
-            ret += resp2
-        return ret
-    elif ex == "okex" and lim > 200:
-        time.sleep(0.1) # make sure we don't get rate limited
-        resp2 = getCandle(ex, tint, COIN=COIN, lim=lim-200, start="2014-01-01T00:00:00.000Z", end=oldestTS)
-        resp += resp2
-        
-    return resp
+    if ex != "binance":
+        resp = resp[:lim]
+    return normalizeCandles(ex, resp)
 
 def liveTicker(ex, COIN="BTC"):
     url = ""
@@ -154,7 +510,7 @@ def liveTicker(ex, COIN="BTC"):
         url = "https://api.pro.coinbase.com/products/%s-USD/ticker" % COIN
 
     try:
-        resp = requests.get(url, params=params)
+        resp = httpGet(url, params=params, ex=ex, endpoint="ticker")
     except:
         print("An error occured while try to communicate with %s" % ex)
         return None
@@ -165,6 +521,83 @@ def liveTicker(ex, COIN="BTC"):
     
     return resp.json()
 
+# ----- Trades ----- #
+# Recent trades from every exchange parsed into one typed array (old->new)
+# buy is True when the taker bought (the trade hit an ask)
+TRADE_DTYPE = np.dtype([("id", np.int64), ("t", np.float64), ("p", np.float64), ("q", np.float64), ("buy", bool)])
+TRADE_LIMIT = {"binance":1000, "bitfinex":1000, "coinbasepro":100, "gemini":500, "okex":100}
+SEQUENTIAL_TRADE_IDS = {"binance", "coinbasepro", "okex"} # the others number trades across every pair
+
+def normalizeTrades(ex, resp):
+    trades = np.zeros(len(resp), dtype=TRADE_DTYPE)
+    if len(resp) == 0:
+        return trades
+
+    if ex == "binance":
+        trades["id"] = [x["a"] for x in resp]
+        trades["t"] = np.array([x["T"] for x in resp], dtype=np.float64) / 1000
+        trades["p"] = [x["p"] for x in resp]
+        trades["q"] = [x["q"] for x in resp]
+        trades["buy"] = [not x["m"] for x in resp] # m: buyer was the maker
+    elif ex == "bitfinex":
+        raw = np.array(resp, dtype=np.float64) # [id, ms, amount, price]
+        trades["id"] = raw[:, 0]
+        trades["t"] = raw[:, 1] / 1000
+        trades["p"] = raw[:, 3]
+        trades["q"] = np.abs(raw[:, 2])
+        trades["buy"] = raw[:, 2] > 0
+    elif ex == "coinbasepro":
+        trades["id"] = [x["trade_id"] for x in resp]
+        trades["t"] = np.array([x["time"].rstrip("Z") for x in resp], dtype="datetime64[ms]").astype(np.int64) / 1000
+        trades["p"] = [x["price"] for x in resp]
+        trades["q"] = [x["size"] for x in resp]
+        trades["buy"] = [x["side"] == "sell" for x in resp] # side is the maker's side
+    elif ex == "gemini":
+        trades["id"] = [x["tid"] for x in resp]
+        trades["t"] = np.array([x["timestampms"] for x in resp], dtype=np.float64) / 1000
+        trades["p"] = [x["price"] for x in resp]
+        trades["q"] = [x["amount"] for x in resp]
+        trades["buy"] = [x["type"] == "buy" for x in resp]
+    elif ex == "okex":
+        trades["id"] = [x["trade_id"] for x in resp]
+        trades["t"] = np.array([x["timestamp"].rstrip("Z") for x in resp], dtype="datetime64[ms]").astype(np.int64) / 1000
+        trades["p"] = [x["price"] for x in resp]
+        trades["q"] = [x["size"] for x in resp]
+        trades["buy"] = [x["side"] == "buy" for x in resp]
+    return trades[np.argsort(trades["id"], kind="stable")]
+
+def recentTrades(ex, COIN="BTC"):
+    url = ""
+    params = {"limit":TRADE_LIMIT.get(ex, 100)}
+
+    if ex == "binance":
+        url = "https://api.binance.com/api/v3/aggTrades"
+        params["symbol"] = COIN+"USDT"
+    elif ex == "bitfinex":
+        url = "https://api-pub.bitfinex.com/v2/trades/t%sUSD/hist" % COIN
+    elif ex == "coinbasepro":
+        url = "https://api.pro.coinbase.com/products/%s-USD/trades" % COIN
+    elif ex == "gemini":
+        url = "https://api.gemini.com/v1/trades/%susd" % COIN.lower()
+        params = {"limit_trades":params["limit"]}
+    elif ex == "okex":
+        url = "https://www.okex.com/api/spot/v3/instruments/%s-USDT/trades" % COIN
+    else:
+        print("No API for exchange %s" % ex)
+        return None
+
+    ts = time.strftime("%m/%d %H:%M:%S", time.localtime(time.time()))
+    try:
+        resp = httpGet(url, params=params, ex=ex, endpoint="trades")
+    except:
+        print("%s - An error occured while try to communicate with %s" % (ts, ex))
+        return None
+
+    if resp.status_code != 200:
+        print("%s - Unable to retrieve trades from %s (%d)" % (ts, ex, resp.status_code))
+        return None
+    return normalizeTrades(ex, resp.json())
+
 def validInterval(ex, interval):
     intervals = getIntervals(ex)
     return interval in intervals
@@ -190,7 +623,12 @@ def getIntervals(ex=None):
         # 6h and 1w are valid
     return intervals
 
-def isValidSymbol(ex, symbol):
+# ----- Symbol catalogs ----- #
+SYMBOL_TTL = 86400  # seconds before an exchange's list of tradeable symbols is downloaded again
+_symbolSets = {}    # exchange -> (time fetched, set of symbols tradeable for USD/USDT)
+_symbolLock = threading.Lock()
+
+def _fetchSymbols(ex):
     url = ""
     params = None
 
@@ -206,30 +644,50 @@ def isValidSymbol(ex, symbol):
         url = "https://www.okex.com/api/spot/v3/instruments"
 
     try:
-        resp = requests.get(url, params=params)
+        resp = httpGet(url, params=params, ex=ex, endpoint="symbols")
     except:
         print("An error occured while try to communicate with %s" % ex)
-        return False
+        return None
 
     if resp.status_code != 200:
         print("%s returned status code (%d)" % (ex, resp.status_code))
-        return False
+        return None
 
+    # index every symbol that trades against the same quote currency getCandle uses
     resp = resp.json()
     if ex == "binance":
-        temp = [x for x in resp["symbols"] if x["symbol"] == (symbol + "USDT")]
-        return len(temp) > 0
-    elif ex == "bitfinex":
-        return (symbol.lower() + "usd") in resp
+        return set([x["symbol"][:-4] for x in resp["symbols"] if x["symbol"].endswith("USDT")])
+    elif ex == "bitfinex" or ex == "gemini":
+        return set([x[:-3].upper() for x in resp if x.endswith("usd")])
     elif ex == "coinbasepro":
-        temp = [x for x in resp if x["id"] == (symbol + "-USD")]
-        return len(temp) > 0
-    elif ex == "gemini":
-        return (symbol.lower() + "usd") in resp
+        return set([x["id"][:-4] for x in resp if x["id"].endswith("-USD")])
     elif ex == "okex":
-        temp = [x for x in resp if x["instrument_id"] == (symbol + "-USDT")]
-        return len(temp) > 0
-    
+        return set([x["instrument_id"][:-5] for x in resp if x["instrument_id"].endswith("-USDT")])
+    return None
+
+def getSymbols(ex, catalog=None):
+    # set of symbols that can be traded for USD/USDT on the exchange
+    # checks memory, then the on-disk catalog, and only downloads the list if both are expired
+    with _symbolLock:
+        if ex in _symbolSets and time.time() - _symbolSets[ex][0] < SYMBOL_TTL:
+            return _symbolSets[ex][1]
+
+    symbols = catalog.get(ex, SYMBOL_TTL) if catalog != None else None
+    if symbols == None:
+        symbols = _fetchSymbols(ex)
+        if symbols == None:
+            return None
+        if catalog != None: catalog.put(ex, symbols)
+
+    with _symbolLock:
+        _symbolSets[ex] = (time.time(), symbols)
+    return symbols
+
+def isValidSymbol(ex, symbol, catalog=None):
+    symbols = getSymbols(ex, catalog)
+    if symbols == None:
+        return False
+    return symbol.upper() in symbols
 
 def granFromInterv(tint):
     num = int(tint[:-1])
@@ -0,0 +1,102 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+import numpy as np
+
+import BTC_API
+
+class CandleCache():
+# Local SQLite store of candle history keyed by (exchange, symbol, interval)
+# so a restart only has to download the candles newer than what was already saved
+
+    MAX_ROWS = 5000     # candles kept per (exchange, symbol, interval), oldest are pruned first
+
+    def __init__(self, path=os.path.join("..", "Cache", "candles.db")):
+        self.path = path
+        self.lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS candles ("
+                     "ex TEXT, symbol TEXT, interval TEXT, t INTEGER,"
+                     "o REAL, h REAL, l REAL, c REAL, v REAL, buy REAL,"
+                     "PRIMARY KEY (ex, symbol, interval, t)) WITHOUT ROWID")
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, ex, symbol, interval, lim):
+        # returns up to lim of the newest candles (new->old) in the same format as BTC_API.getCandle
+        with self.lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT t, o, h, l, c, v, buy FROM candles "
+                                "WHERE ex=? AND symbol=? AND interval=? ORDER BY t DESC LIMIT ?",
+                                (ex, symbol, interval, lim)).fetchall()
+            conn.close()
+
+        # taker buy volume is only stored for exchanges that provide it (NULL comes back as NaN)
+        ret = BTC_API.emptyCandles(len(rows))
+        if len(rows) > 0:
+            cols = np.array(rows, dtype=np.float64)
+            ret["t"] = cols[:, 0]
+            for i, col in enumerate(("o", "h", "l", "c", "v", "buy")):
+                ret[col] = cols[:, i+1]
+        return ret
+
+    def save(self, ex, symbol, interval, data):
+        rows = []
+        for d in data.tolist():
+            buy = None if math.isnan(d[6]) else d[6]
+            rows.append((ex, symbol, interval) + d[:6] + (buy,))
+
+        with self.lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO candles VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+            # prune the oldest candles so the cache doesn't grow forever
+            conn.execute("DELETE FROM candles WHERE ex=? AND symbol=? AND interval=? AND t < "
+                         "(SELECT t FROM candles WHERE ex=? AND symbol=? AND interval=? ORDER BY t DESC LIMIT 1 OFFSET ?)",
+                         (ex, symbol, interval, ex, symbol, interval, self.MAX_ROWS-1))
+            conn.commit()
+            conn.close()
+
+class SymbolCatalog():
+# On-disk copy of each exchange's tradeable symbols so startup doesn't have to
+# download every exchange's full instrument list on every launch
+
+    def __init__(self, path=os.path.join("..", "Cache", "symbols.json")):
+        self.path = path
+        self.lock = threading.Lock()
+        self.catalogs = {}  # exchange -> {"time":epoch fetched, "symbols":[...]}
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.catalogs = json.load(f)
+            except ValueError:
+                print("WARNING: Symbol catalog is corrupt, it will be downloaded again")
+
+    def get(self, ex, ttl):
+        # returns the set of symbols for the exchange, or None if missing or older than ttl seconds
+        with self.lock:
+            entry = self.catalogs.get(ex)
+            if entry == None or time.time() - entry["time"] >= ttl:
+                return None
+            return set(entry["symbols"])
+
+    def put(self, ex, symbols):
+        with self.lock:
+            self.catalogs[ex] = {"time":time.time(), "symbols":sorted(symbols)}
+            with open(self.path, 'w') as f:
+                json.dump(self.catalogs, f)
@@ -1,5 +1,6 @@
 import time
 import gc
+import numpy as np
 from matplotlib import rcParams as rcparams
 from matplotlib.backend_bases import MouseButton
 import matplotlib.pyplot as plt
@@ -10,6 +11,19 @@ import matplotlib.collections as mcoll
 
 from Indicators import *
 from Configuration import SettingsDialog as confDiag
+from Consolidation import consolidate, alignCandles
+from Series import RingBuffer, RollingWindow, RangeIndex, ViewRange
+from Fills import SegmentedFill
+import BTC_API as api
+import Kernels
+
+def buyRatio(candles):
+    # share of the volume that was taker buys, from every exchange that has it (0.5 if unknown)
+    # candles: CANDLE_DTYPE array (exchanges x intervals), returns the ratio of every interval
+    known = ~np.isnan(candles["buy"]) & (candles["v"] > 0)
+    buy = np.where(known, candles["buy"], 0).sum(axis=0)
+    vol = np.where(known, candles["v"], 0).sum(axis=0)
+    return np.where(vol > 0, buy / np.where(vol > 0, vol, 1), 0.5)
 
 class Colors():
 
@@ -31,54 +45,37 @@ class Colors():
 
 class PriceChart():
 
-    def __init__(self, ax, xlims):
+    def __init__(self, ax, xlims, bbPeriod=20, bbStdev=2):
         self.ax = ax
         self.xlims = xlims
 
-        self.bbands = [[],[],[]]            # list of lists of data that creates the three lines for the BBands
+        self.bbands = [RingBuffer(), RingBuffer(), RingBuffer()] # data that creates the three lines for the BBands
         self.bbandOn = False                # display bbands
+        self.bbPeriod = bbPeriod            # number of closing prices the BBands are calculated from
+        self.bbStdev = bbStdev              # distance of the upper/lower BBands from the mean (in standard deviations)
+        self.bbWindow = None                # rolling mean/stdev of the last bbPeriod closing prices
         self.bbandsPlt = [None, None, None] # list of line objects that create the BBands
         self.bbandsUpdated = False          # bbands data has been updated
-        self.candlesticks = ([],[])         # tuple of lists of lines and rectangle patches forming candlesticks
+        self.candlesticks = (RingBuffer(dtype=object, fill=None), RingBuffer(dtype=object, fill=None)) # lines and rectangle patches forming candlesticks
         self.fibs = [[],[]]                 # tuple of lists of fib retrace level lines and text
         self.fibOn = False                  # display fib levels
         self.grid = None                    # grid lines collection
+        self.highs = RangeIndex(True)       # finds the highest high (and its interval) in any range of intervals
         self.hiLine = None                  # line object marking the highest price in the viewing window
         self.hiText = None                  # text to go with the highest price marker
-        self.last20 = []                    # keep track of last 20 closing prices for BBands
         self.loaded = False                 # price chart has been loaded and initialized
+        self.lows = RangeIndex(False)       # finds the lowest low in any range of intervals
         self.loLine = None                  # line object marking the lowest price in the viewing window
         self.loText = None                  # text to go with the lowest price marker
         self.lvlTextPos = 0                 # x-position of the text for the price level markers
-        self.ohlc = []                      # data for each period of price data: [index, open, high, low, close]
+        self.ohlc = RingBuffer(shape=(5,))  # data for each period of price data: [index, open, high, low, close]
         self.title = None                   # text object showing live ticker price and time left in candle
+        self.view = ViewRange()             # intervals the bband lines are given (visible ones plus a margin)
 
         self.ax.set_ylabel("Price (USD)")
         self.ax.set_facecolor(Colors.background)
 
     # ----- Private Functions ----- #
-    def _calcBBfromHist(self, data, histCnt):
-        numEx = len(data)
-        smaBBandStart = histCnt + 20
-        sumPd = 0
-        sqSum = 0
-        
-        # First EMA value is a SMA
-        # calculate SMA for first X intervals of emaX
-        for i in range(20):
-            idx = smaBBandStart-1-i
-            temp = sum([float(x[idx][4]) for x in data if x[idx][4] != 0]) / len([float(x[idx][4]) for x in data if x[idx][4] != 0])
-            self.last20.append(temp)
-            sumPd += temp
-            sqSum += temp * temp
-
-        mean = sumPd / 20
-        var = sqSum / 20 - mean * mean
-        stdev = var**0.5
-        self.bbands[0].append(mean+stdev*2)
-        self.bbands[1].append(mean)
-        self.bbands[2].append(mean-stdev*2)
-
     def _initHiLoLevels(self):           
         maxHi = self.getHighestPrice()
         self.hiLine, = self.ax.plot(self.xlims,
@@ -121,42 +118,48 @@ class PriceChart():
         self.ax.add_collection(self.grid)
 
     def _initCandlesticks(self):
-        self.candlesticks = [[],[]] #candle(self.axes[0], self.ohlc, width=0.5, colorup=Colors.green, colordown=Colors.red)
-        for i in range(len(self.ohlc)):
+        for i in range(self.ohlc.start, len(self.ohlc)):
             self._createCandlestick(i=i)
             self.drawCandlesticks(i=i)
 
     def _initBBands(self): 
-        self.bbandsPlt[0], = self.ax.plot(range(len(self.bbands[0])-1), self.bbands[0][1:], color=Colors.blue, linewidth=0.6)
-        self.bbandsPlt[1], = self.ax.plot(range(len(self.bbands[1])-1), self.bbands[1][1:], color=Colors.blue, linestyle=(0,(5,10)), linewidth=0.6)
-        self.bbandsPlt[2], = self.ax.plot(range(len(self.bbands[2])-1), self.bbands[2][1:], color=Colors.blue, linewidth=0.6)
-        self.bbandFill = self.ax.fill_between(range(len(self.bbands[0])-1), self.bbands[0][1:], self.bbands[2][1:], facecolor=Colors.bband_fill, interpolate=True)
+        self.bbandsPlt[0], = self.ax.plot(*self.bbands[0].xy(), color=Colors.blue, linewidth=0.6)
+        self.bbandsPlt[1], = self.ax.plot(*self.bbands[1].xy(), color=Colors.blue, linestyle=(0,(5,10)), linewidth=0.6)
+        self.bbandsPlt[2], = self.ax.plot(*self.bbands[2].xy(), color=Colors.blue, linewidth=0.6)
+        self.bbandFill = SegmentedFill(self.ax, self.bbands[0], self.bbands[2], facecolor=Colors.bband_fill)
+
+    def _setLive(self):
+        self.highs.setLive(len(self.ohlc)-1, self.ohlc[-1][2])
+        self.lows.setLive(len(self.ohlc)-1, self.ohlc[-1][3])
 
     def _createCandlestick(self, i):
         # create new candlestick and add it to the axis
-        self.candlesticks[0].append(mlines.Line2D([i, i], [0, 0], linewidth=0.5))
-        self.ax.add_line(self.candlesticks[0][-1])
-        self.candlesticks[1].append(mpatches.Rectangle((i - 0.25, 0), width=0.5, height=0))
-        self.ax.add_patch(self.candlesticks[1][-1])
+        line = mlines.Line2D([i, i], [0, 0], linewidth=0.5)
+        rect = mpatches.Rectangle((i - 0.25, 0), width=0.5, height=0)
+        self.ax.add_line(line)
+        self.ax.add_patch(rect)
+        # take the oldest candlestick off the chart once it's no longer kept
+        for old in (self.candlesticks[0].append(line), self.candlesticks[1].append(rect)):
+            if old is not None: old.remove()
 
     # ----- Public Functions ----- #
-    def loadHistory(self, idx, data):
-        self.ohlc.append([idx] + [0]*4)
-        #for j in range(1,5):
-        self.ohlc[idx][1] = sum([float(x[1]) for x in data]) / len(data)
-        self.ohlc[idx][4] = sum([float(x[4]) for x in data]) / len(data)
-        self.ohlc[idx][2] = max([float(x[2]) for x in data])
-        self.ohlc[idx][3] = min([float(x[3]) for x in data])
-
-        # BBands
-        self.last20 = self.last20[1:] + [self.ohlc[idx][4]]
-        newMean = sum(self.last20) / 20
-        sqSum = sum([(x-newMean)**2 for x in self.last20])
-        newStdev = (sqSum / 20)**0.5
-
-        self.bbands[0].append(newMean+newStdev*2)
-        self.bbands[1].append(newMean)
-        self.bbands[2].append(newMean-newStdev*2)
+    def loadHistory(self, history, histCnt):
+        # history: consolidated candles (new->old), the ones before the first histCnt are only used for the BBands
+        candles = history[histCnt-1::-1]
+        self.ohlc.extend(np.column_stack([np.arange(histCnt), candles["o"], candles["h"], candles["l"], candles["c"]]))
+        # the newest candle is still live
+        self.highs.load(candles["h"][:-1])
+        self.lows.load(candles["l"][:-1])
+        self._setLive()
+
+        # BBands of every interval (from its closing price and the ones before it)
+        closes = history["c"][histCnt+self.bbPeriod-2::-1]
+        mean = Kernels.rollingMean(closes, self.bbPeriod)
+        stdev = Kernels.rollingStd(closes, self.bbPeriod)
+        self.bbands[0].extend(mean+stdev*self.bbStdev)
+        self.bbands[1].extend(mean)
+        self.bbands[2].extend(mean-stdev*self.bbStdev)
+        self.bbWindow = RollingWindow(self.bbPeriod, closes[-self.bbPeriod:])
 
     def initPlot(self, xlims):
         self.xlims = xlims
@@ -169,15 +172,18 @@ class PriceChart():
 
     def incCurrIntvl(self, idx):
         # update candlestick chart
+        self.highs.close(self.ohlc[-1][2])
+        self.lows.close(self.ohlc[-1][3])
         self.ohlc.append([idx] + [0]*4)
-        self.bbands[0].append(self.bbands[0][-1])
-        self.bbands[1].append(self.bbands[1][-1])
-        self.bbands[2].append(self.bbands[2][-1])
-        self.last20 = self.last20[1:] + [0]
+        self._setLive()
+        for bb in self.bbands:
+            bb.append(bb[-1])
+        # the new candle has no close yet, start it from the last one
+        self.bbWindow.push(self.ohlc[-2][4])
         self._createCandlestick(idx)
 
         # make sure bbands are updated and drawn
-        self.updateBBands(update=True)
+        self.updateBBands(self.ohlc[-2][4])
         self.drawBBands()
 
     # ----- Attributes, getters/setters ----- #
@@ -229,29 +235,29 @@ class PriceChart():
         return lo, hi
 
     def getHighestPrice(self):
-        idx = int(max(0, self.xlims[0]))
-        idx2 = int(min(len(self.ohlc), self.xlims[1]))
-        return max([x[2] for x in self.ohlc[idx:idx2]])
+        return self.highs.query(self.xlims[0], self.xlims[1]-1)[1]
 
     def getLowestPrice(self):
-        idx = int(max(0, self.xlims[0]))
-        idx2 = int(min(len(self.ohlc), self.xlims[1]))
-        return min([x[3] for x in self.ohlc[idx:idx2]])
+        return self.lows.query(self.xlims[0], self.xlims[1]-1)[1]
+
+    def updateCandle(self, idx):
+        # a past candle was changed
+        self.highs.update(idx, self.ohlc[idx][2])
+        self.lows.update(idx, self.ohlc[idx][3])
 
     def getCandle(self, idx):
-        if 0 <= idx <= len(self.ohlc):
+        if self.ohlc.start <= idx < len(self.ohlc):
             return self.ohlc[idx]
         else:
             print("Invalid candle index")
     
     # ----- Update and Draw ----- #
-    def updateCandlesticks(self, data):
-        #for i in range(1,5):
-        #    self.ohlc[-1][i] = sum([float(x[0][i]) for x in data]) / len(data)
-        self.ohlc[-1][1] = sum([float(x[0][1]) for x in data]) / len(data)
-        self.ohlc[-1][4] = sum([float(x[0][4]) for x in data]) / len(data)
-        self.ohlc[-1][2] = max([float(x[0][2]) for x in data])
-        self.ohlc[-1][3] = min([float(x[0][3]) for x in data])
+    def updateCandlesticks(self, candle):
+        # candle: the consolidated candle of the current interval
+        # skip it if every exchange is down (no price)
+        if float(candle[0]["c"]) == 0: return
+        self.ohlc[-1][1:5] = [float(candle[0]["o"]), float(candle[0]["h"]), float(candle[0]["l"]), float(candle[0]["c"])]
+        self._setLive()
         
     def drawCandlesticks(self, i=None):
         if i == None:
@@ -302,14 +308,12 @@ class PriceChart():
     def updateFibLevels(self, hi=None,lo=None):
         if not self.fibOn: return
             
-        if hi == None: hi = self.getHighestPrice()
-        if lo == None: lo = self.getLowestPrice()
+        # fib levels are anchored at the (newest) highest high and lowest low in the window
+        xh, high = self.highs.query(self.xlims[0], self.xlims[1]-1)
+        xl, low = self.lows.query(self.xlims[0], self.xlims[1]-1)
+        if hi == None: hi = high
+        if lo == None: lo = low
         diff = hi - lo
-      
-        xh = [i for i,d in enumerate(self.ohlc) if d[2] == hi]
-        xl = [i for i,d in enumerate(self.ohlc) if d[3] == lo]
-        xh = xh[-1]
-        xl = xl[-1]
         if xh == xl:
             for fib,txt in zip(self.fibs[0], self.fibs[1]):
                 fib.set_data([0,0], [0,0])
@@ -349,37 +353,35 @@ class PriceChart():
         self.fibs[1][4].set_text("%.2f" % fib78_6)
         self.fibs[1][4].set_position((self.xlims[1]+self.lvlTextPos, fib78_6))
 
-    def updateBBands(self, update=False):
-        # avoid doing a costly calculation unless the new value is more than one stdev away
-        stdev = (self.bbands[0][-1] - self.bbands[1][-1])/2
-        if not update and abs(self.ohlc[-1][4] - self.last20[-1]) < stdev: return
-
-        self.last20[-1] = self.ohlc[-1][4]
-        newMean = sum(self.last20) / 20
-        sqSum = sum([(x-newMean)**2 for x in self.last20])
-        newStdev = (sqSum / 20)**0.5
+    def updateBBands(self, close=None):
+        # close of the newest interval (defaults to its candle's close), the bands are exact every time
+        if close == None: close = self.ohlc[-1][4]
+        if close == 0: return
+        self.bbWindow.replace(close)
+        newMean = self.bbWindow.mean()
+        newStdev = self.bbWindow.std()
 
-        self.bbands[0][-1] = (newMean+newStdev*2)
+        self.bbands[0][-1] = (newMean+newStdev*self.bbStdev)
         self.bbands[1][-1] = (newMean)
-        self.bbands[2][-1] = (newMean-newStdev*2)
+        self.bbands[2][-1] = (newMean-newStdev*self.bbStdev)
         self.bbandsUpdated = True
 
     def drawBBands(self):
         if not self.bbandOn or not self.bbandsUpdated: return
         
         for bbp, bb in zip(self.bbandsPlt, self.bbands):
-            bbp.set_data(range(len(bb)-1), bb[1:])
-        self.bbandFill.remove()
-        self.bbandFill = self.ax.fill_between(range(len(self.bbands[0])-1), self.bbands[0][1:], self.bbands[2][1:], facecolor=Colors.bband_fill, interpolate=True)
+            bbp.set_data(*bb.xy(lims=self.view.get(self.xlims)))
+        # only the newest intervals of the fill are rebuilt
+        self.bbandFill.update()
         self.bbandsUpdated = False
 
-    def update(self, data, xlims):
+    def update(self, candle, xlims):
         needFullRedraw = False
         self.xlims = xlims
 
         tempHi = self.getHighestPrice()
         tempLo = self.getLowestPrice()
-        self.updateCandlesticks(data)
+        self.updateCandlesticks(candle)
         self.drawCandlesticks()
         # check if highest or lowest price changed (new data or panning window) and update the markers
         newHi = self.getHighestPrice()
@@ -402,7 +404,7 @@ class PriceChart():
     def efficientDraw(self, redraw):
         if redraw:
             if self.bbandOn:
-                self.ax.draw_artist(self.bbandFill)
+                self.bbandFill.draw(self.xlims)
                 for bband in self.bbandsPlt:
                     self.ax.draw_artist(bband)
                     
@@ -413,7 +415,7 @@ class PriceChart():
             self.ax.draw_artist(self.grid)
             
             # draw all candlesticks in current viewing window (within xlims)
-            idx0 = max(0, self.xlims[0])
+            idx0 = max(self.candlesticks[0].start, self.xlims[0])
             idx1 = min(self.xlims[1]+1, len(self.candlesticks[0]))
             if idx1 == len(self.candlesticks[0]): idx1 -= 1
             for i in range(idx0, idx1):
@@ -432,13 +434,13 @@ class VolumeChart():
         self.ax = ax
         self.xlims = xlims
 
-        self.volBars = []                   # stores the rectangle patches for the volume bar graph
+        self.volBars = []                   # stores the rectangle patches for the volume bar graph (by exchange)
         self.vol = []                       # stores the value of the cumulative volume per period by exchange
-        self.volRatio = []                  # stores the ratio of buys/total for each period
+        self.volRatio = RingBuffer()        # stores the ratio of buys/total for each period
         self.volRatioText = None            # text object that displays the buy volume ratio of the current viewing window
-        self.volEma = []
-        self.buyEma = []                    # values for the EMA of buy volume
-        self.sellEma = []                   # values for the EMA of sell volume
+        self.volEma = RingBuffer()          # values for the EMA of volume (first value is the SMA before the history)
+        self.buyEma = RingBuffer()          # values for the EMA of buy volume
+        self.sellEma = RingBuffer()         # values for the EMA of sell volume
         self.volEmaPd = 30                  # period for the volume EMAs
         self.volEmaWt = 2/(self.volEmaPd+1) # weight for the volume EMAs
         self.volEmaPlt = None
@@ -448,54 +450,23 @@ class VolumeChart():
         self.legendLabels = []              # list of strings for the legend
         self.legend = None                  # legend object
         self.loaded = False
+        self.view = ViewRange()             # intervals the EMA lines are given (visible ones plus a margin)
 
         self.ax.set_ylabel("Volume (%s)" % coinPair)
         self.ax.set_facecolor(Colors.background)
 
     # ----- Private Functions ----- #
-    def _calcEMAfromHist(self, data, histCnt):
-        numEx = len(data)
-        emaVolStart = histCnt + self.volEmaPd
-        sumPd = 0
-        sqSum = 0
-        self.buyEma = [0]
-        self.sellEma = [0]
-        self.volEma = [0]
-        
-        # First EMA value is a SMA
-        # calculate SMA for first X intervals of emaX
-        for i in range(self.volEmaPd):
-            idx = emaVolStart-1-i
-            totalVol = sum([float(x[idx][5]) for x in data])
-            self.volEma[0] += totalVol
-            if len(data[0][idx]) < 10:
-                self.buyEma[0] += totalVol * 0.5
-                self.sellEma[0] += totalVol * 0.5
-            else:
-                self.buyEma[0] += totalVol * (float(data[0][idx][9]) / float(data[0][idx][5]))
-                self.sellEma[0] += totalVol * (1 - float(data[0][idx][9]) / float(data[0][idx][5]))         
-
-        self.volEma[0] /= self.volEmaPd
-        self.buyEma[0] /= self.volEmaPd
-        self.sellEma[0] /= self.volEmaPd
-        
     def _initVolBars(self):
         numEx = len(self.vol)
-        self.volBars.append(self.ax.bar(
-                    range(len(self.vol[0])),
-                    self.vol[0],
-                    linewidth=1).patches)
+        self.volBars.append(self._createBars(self.vol[0], 1))
         if self.showVolBreakdown:
             for i in range(1,numEx):
-                self.volBars.append(self.ax.bar(
-                    range(len(self.vol[i])),
-                    self.vol[i],
-                    linewidth=0.7).patches)
+                self.volBars.append(self._createBars(self.vol[i], 0.7))
                 
         for bar,v,r in zip(self.volBars[0], self.vol[0], self.volRatio):
             bar.set_height(v)
             # Highlight bars depending on the ratio of taker buys:sells
-            # Binance is the only exchange that provides this info
+            # (from binance's candles, or from trades for the other exchanges)
             if r > 0.5:
                 if self.showVolBreakdown:
                     bar.set_edgecolor(Colors.green)
@@ -518,44 +489,53 @@ class VolumeChart():
                     bar.set_height(v)
 
         self.volEmaPlt, = self.ax.plot(
-            range(len(self.volEma)-1), self.volEma[1:], "-", c=Colors.volEMA, linewidth=0.9)
+            *self.volEma.xy(1), "-", c=Colors.volEMA, linewidth=0.9)
         self.buyEmaPlt, = self.ax.plot(
-            range(len(self.buyEma)-1), self.buyEma[1:], "-", c=Colors.buyEMA, linewidth=0.9)
+            *self.buyEma.xy(1), "-", c=Colors.buyEMA, linewidth=0.9)
         self.sellEmaPlt, = self.ax.plot(
-            range(len(self.sellEma)-1), self.sellEma[1:], "-", c=Colors.sellEMA, linewidth=0.9)
+            *self.sellEma.xy(1), "-", c=Colors.sellEMA, linewidth=0.9)
 
         self.volRatioText = self.ax.text(0, 0, "", fontsize=9, color=Colors.text)
 
+    def _createBars(self, vol, linewidth):
+        # a bar for every interval that is still kept
+        x, y = vol.xy()
+        bars = RingBuffer(dtype=object, fill=None, first=vol.start)
+        bars.extend(self.ax.bar(x, y, linewidth=linewidth).patches)
+        return bars
+
     def _createBar(self):
         for i in range(len(self.volBars)):
-            self.volBars[i].append(mpatches.Rectangle((len(self.vol[0])-1 - 0.4, 0), width=0.8, height=0, color=self.volBars[i][-1].get_fc()))
-            self.ax.add_patch(self.volBars[i][-1])
+            bar = mpatches.Rectangle((len(self.vol[0])-1 - 0.4, 0), width=0.8, height=0, color=self.volBars[i][-1].get_fc())
+            self.ax.add_patch(bar)
+            # take the oldest bar off the chart once it's no longer kept
+            old = self.volBars[i].append(bar)
+            if old is not None: old.remove()
   
     # ----- Public Functions ----- #
-    def loadHistory(self, idx, data):
-        numEx = len(data)
-
-        if len(self.vol) == 0:
-            self.vol = [[] for i in range(numEx)]
-            
-        # sum volume from all exchanges
-        for j in range(numEx):           
-            self.vol[j].append( sum([float(x[5]) for x in data[j:]]) )
+    def loadHistory(self, candles, histCnt):
+        # candles: every exchange's aligned candles (exchanges x intervals, new->old, missing ones are empty)
+        # the volEmaPd intervals before the first histCnt are only used to start the EMAs
+        candles = candles[:, histCnt+self.volEmaPd-1::-1]
+        numEx = len(candles)
+
+        # volume bars are stacked, vol[j] is the volume of exchange j and every exchange after it
+        stacked = np.cumsum(candles["v"][::-1], axis=0)[::-1]
+        self.vol = [RingBuffer() for i in range(numEx)]
+        for j in range(numEx):
+            self.vol[j].extend(stacked[j, self.volEmaPd:])
 
         # calc buy volume percentage
-        # ignore if binance isn't being tracked, or server is down, or has no volume
-        if len(data[0]) < 10 or float(data[0][5]) == 0:
-            self.volRatio.append(0.5)
-        else:
-            self.volRatio.append( (float(data[0][9]) / float(data[0][5])) )
+        # ignores exchanges that don't have buy volume, or are down, or have no volume
+        ratio = buyRatio(candles)
+        self.volRatio.extend(ratio[self.volEmaPd:])
 
-        # update volume EMAs
-        self.volEma.append(self.vol[0][idx] * self.volEmaWt +\
-                            self.volEma[-1] * (1 - self.volEmaWt))
-        self.buyEma.append((self.volRatio[idx] * self.vol[0][idx]) * self.volEmaWt +\
-                           self.buyEma[-1] * (1 - self.volEmaWt))
-        self.sellEma.append(((1 - self.volRatio[idx]) * self.vol[0][idx]) * self.volEmaWt +\
-                           self.sellEma[-1] * (1 - self.volEmaWt))
+        # volume EMAs, the first value is the SMA of the intervals before the history
+        total = stacked[0]
+        for ema, vol in ((self.volEma, total), (self.buyEma, total * ratio), (self.sellEma, total * (1 - ratio))):
+            sma = vol[:self.volEmaPd].mean()
+            ema.append(sma)
+            ema.extend(Kernels.ema(vol[self.volEmaPd:], self.volEmaWt, sma))
 
     def initPlot(self, xlims):
         self.xlims = xlims
@@ -585,9 +565,9 @@ class VolumeChart():
 
     def getMaxVolume(self, mode):
         if mode == "window":
-            return max(self.vol[0][max(0, self.xlims[0]):min(len(self.vol[0]), self.xlims[1])])
+            return self.vol[0][max(0, self.xlims[0]):min(len(self.vol[0]), self.xlims[1])].max()
         elif mode == "all":
-            return max(self.vol[0])
+            return self.vol[0].values().max()
         else:
             return -1
 
@@ -599,10 +579,7 @@ class VolumeChart():
                 if r > 0.5: bar.set_edgecolor(Colors.green)
                 elif r < 0.5: bar.set_edgecolor(Colors.red)
             for i in range(1,len(self.vol)):
-                self.volBars.append(self.ax.bar(
-                    range(len(self.vol[i])),
-                    self.vol[i],
-                    linewidth=0.7).patches)
+                self.volBars.append(self._createBars(self.vol[i], 0.7))
         elif self.showVolBreakdown:
             for bar,r in zip(self.volBars[0], self.volRatio):
                 if r > 0.5: bar.set_color(Colors.green)
@@ -620,7 +597,7 @@ class VolumeChart():
         if labels != None:
             self.legendLabels = labels
         if self.showVolBreakdown:
-            self.legend = self.ax.legend([x[0] for x in self.volBars], self.legendLabels,
+            self.legend = self.ax.legend([x[-1] for x in self.volBars], self.legendLabels,
                                               fancybox=False,
                                               shadow=False,
                                               frameon=False,
@@ -638,10 +615,7 @@ class VolumeChart():
         # (i.e. vol[0] is sum of all exchanges, vol[-1] is the volume of a single exchange)
         for i in range(numEx):
             self.vol[i][-1] = sum([float(x[0][5]) for x in data[i:]])
-        if len(data[0][0]) < 10 or float(data[0][0][5]) == 0:    # in case binance data isn't included
-            self.volRatio[-1] = 0.5
-        else:
-            self.volRatio[-1] = (float(data[0][0][9]) / float(data[0][0][5]))
+        self.volRatio[-1] = buyRatio(np.array([x[0] for x in data]))
 
         self.volEma[-1] = self.vol[0][-1] * self.volEmaWt +\
                             self.volEma[-2] * (1 - self.volEmaWt)
@@ -675,21 +649,20 @@ class VolumeChart():
                     self.volBars[i][-1].set_height(self.vol[i][-1])
                 
             # Update y-axis limits to be just above the max volume
-            startIdx = max(0, self.xlims[0])
-            maxVol = max(self.vol[0][startIdx:self.xlims[1]])
+            startIdx = max(self.vol[0].start, self.xlims[0])
+            maxVol = self.vol[0][startIdx:self.xlims[1]].max()
             self.ax.set_ylim(0, maxVol*1.06)
 
             # Draw EMA lines of buy and sell volume
-            self.volEmaPlt.set_data(range(len(self.volEma)-1), self.volEma[1:])
-            self.buyEmaPlt.set_data(range(len(self.buyEma)-1), self.buyEma[1:])
-            self.sellEmaPlt.set_data(range(len(self.sellEma)-1), self.sellEma[1:])
+            lims = self.view.get(self.xlims)
+            self.volEmaPlt.set_data(*self.volEma.xy(1, lims))
+            self.buyEmaPlt.set_data(*self.buyEma.xy(1, lims))
+            self.sellEmaPlt.set_data(*self.sellEma.xy(1, lims))
 
             # Calculate the percentage of buys from total volume (in current window)
-            buyRat = 0
             stopIdx = min(self.xlims[1], len(self.vol[0]))
-            for i in range(startIdx, stopIdx):
-                buyRat += self.volRatio[i] * self.vol[0][i]
-            buyRat /= sum([x for x in self.vol[0][startIdx:stopIdx]])
+            vol = self.vol[0][startIdx:stopIdx]
+            buyRat = (self.volRatio[startIdx:stopIdx] * vol).sum() / vol.sum()
             
             xloc = (self.xlims[1] - self.xlims[0])*0.94 + self.xlims[0] #self.xlims[1] - self._pixelsToPoints(50)#(self.xlims[1] - self.xlims[0])*0.94 + self.xlims[0]
             self.volRatioText.set_text("%.1f%%" % (buyRat * 100))
@@ -706,7 +679,7 @@ class VolumeChart():
         if redraw:
             if self.showVolBreakdown:
                 self.ax.draw_artist(self.legend)
-            idx0 = max(0, self.xlims[0])
+            idx0 = max(self.volBars[0].start, self.xlims[0])
             idx1 = min(self.xlims[1]+1, len(self.volBars[0]))
             if idx1 == len(self.volBars[0]): idx1 -= 1
             for i in range(idx0, idx1):
@@ -753,6 +726,10 @@ class CandlestickChart():
         self.fig.canvas.mpl_connect("axes_enter_event", self._mouseEnter)
         self.fig.canvas.mpl_connect("axes_leave_event", self._mouseLeave)
         self.fig.canvas.mpl_connect("figure_leave_event", self._mouseLeave)
+        # any user input wakes up the main loop (see waitForEvents)
+        for event in ("resize_event", "close_event", "scroll_event", "button_press_event", "button_release_event",
+                      "key_press_event", "motion_notify_event", "figure_enter_event", "figure_leave_event"):
+            self.fig.canvas.mpl_connect(event, self._wake)
 
         # Cursor
         self.cursor = mlines.Line2D([-1, -1], [0, 100000], linewidth=1, color=Colors.cursor)
@@ -770,9 +747,12 @@ class CandlestickChart():
         self.active = False                 # figure is "active" (mouse is on figure)
         self.backgrounds = None             # canvas image for each axis to draw more efficently [blank canvas, canvas with non-changing objects drawn]
         self.currInt = 0                    # index of the current interval
+        self.exValid = None                 # for every interval, whether each exchange's data was included
+        self.exCandles = None               # for every interval, each exchange's candle (what the chart's candle is consolidated from)
         self.kill = False                   # application has been closed
         self.enableIdle = conf["enableIdle"]# idling is enabled (updated less often)
         self.fullRedraw = False             # figure and all objects should be completely redrawn
+        self.input = False                  # user input since the last refresh
         self.lastMouseX = 0                 # last record x-position of the mouse
         self.loaded = False                 # whether or not history was loaded and drawn
         self.numCandles = conf["viewSize"]  # number of candles to view at launch
@@ -782,11 +762,13 @@ class CandlestickChart():
         self.resaveBG = False               # canvas backgrounds need to be resaved (e.g. figure resized)
         self.settings = None                # settings dialog
         self.timeframe = conf["timeFrame"]  # string of timeframe (e.g. "1h")
-        self.timestamps = []                # store epoch timestamps of every interval
+        self.consolidation = conf.get("consolidation", "mean") # how exchanges are combined into one candle (see Consolidation.consolidate)
+        self.timestamps = RingBuffer(dtype=np.int64) # store epoch timestamps of every interval
+        self.waiting = False                # main loop is waiting for user input (see waitForEvents)
         self.xlims = [100 - self.numCandles, 100 + self.numCandles]   # bounds of the x-axis
 
         # price chart
-        self.priceChart = PriceChart(self.axes[0], self.xlims)
+        self.priceChart = PriceChart(self.axes[0], self.xlims, conf.get("bbPeriod", 20), conf.get("bbStdev", 2))
         self.priceChart.toggleFib(conf["showFib"])
         self.priceChart.toggleBBand(conf["showBBands"])
 
@@ -835,7 +817,7 @@ class CandlestickChart():
     def _handleScroll(self, event):
         dx = int(event.step)
         while abs(dx) > 0:
-            if -1 <= self.xlims[0] + dx < self.currInt - 1:
+            if self.priceChart.ohlc.start - 1 <= self.xlims[0] + dx < self.currInt - 1:
                 self._adjustXlims(dx, 0)
 
                 # adjust cursor and text
@@ -895,20 +877,26 @@ class CandlestickChart():
         self.pan = False
         self.active = False
     
+    def _wake(self, event):
+        self.input = True
+        if self.waiting:
+            self.waiting = False
+            self.fig.canvas.stop_event_loop()
+
     def _mouseMove(self, event):
         if not self.loaded: return
         if event.xdata == None: return
         if self.pan:
             dx = self._pixelsToPoints(event.x - self.lastMouseX)
             if abs(dx) < 1: return
-            if -1 <= self.xlims[0]-dx < self.currInt-1:
+            if self.priceChart.ohlc.start - 1 <= self.xlims[0]-dx < self.currInt-1:
                 self.lastMouseX = event.x
                 self._adjustXlims(-dx, -dx)               
 
         if self.cursorOn:
             x = int(round(event.xdata))
             # cursor is within bounds of candlestick data - round to nearest interval
-            if 0 <= x <= self.currInt:
+            if self.priceChart.ohlc.start <= x <= self.currInt:
                 cx = x
             else:
                 cx = event.xdata
@@ -998,7 +986,7 @@ class CandlestickChart():
         self.redraw = True           
 
     def _updateCursorText(self, x, y):
-        if 0 <= x <= self.currInt:
+        if self.priceChart.ohlc.start <= x <= self.currInt:
             timeStr = time.strftime("%d %b %Y %H:%M", time.localtime(self.timestamps[x]))
             tempCandle = self.priceChart.getCandle(x)
             self.cursorText0.set_text(
@@ -1028,30 +1016,6 @@ class CandlestickChart():
     def _pixelsToPoints(self, px):
         return px * (self.xlims[1]-self.xlims[0]) / self._getPlotWidthPixels()
 
-    def _checkTimestamps(self, data, histCnt):
-        numEx = len(data)
-        fullHist = min([len(x) for x in data])
-        medT = sorted([x[fullHist-1][0] for x in data])[int(numEx/2)]
-        medT2 = sorted([x[fullHist-2][0] for x in data])[int(numEx/2)]
-        gran = medT2 - medT
-
-        newData = [[] for x in data]
-        expectedTimestamp = medT + gran * (fullHist-1)
-        # shift data when needed if exchange was down (to reallign)
-        for i in range(fullHist):
-            #avgT = sum([x[i][0] for x in data]) / numEx
-            for j in range(numEx):
-                # timestamp is less than the average
-                if data[j][i][0] != expectedTimestamp:#avgT:
-                    # add a dummy entry to shift the data
-                    data[j] = data[j][:i] + [[0]*6] + data[j][i:]
-                    newData[j].append([0]*6 + [False])
-                else:
-                    newData[j].append(data[j][i] + [True])
-            expectedTimestamp -= gran
-        return newData
-
-
     # ----- MPL Figure attribute functions ----- #
     def setTitle(self, title):
         try:
@@ -1067,42 +1031,30 @@ class CandlestickChart():
 
     # ----- Only run at startup ----- #
     def historyNeeded(self):
-        return max(26 + 9, self.volumeChart.volEmaPd)
+        return max(26 + 9, self.volumeChart.volEmaPd, self.priceChart.bbPeriod)
         
     def loadHistory(self, data, histCnt):
         numEx = len(data)
 
-        # calc volume EMAs from history
-        self.volumeChart._calcEMAfromHist(data, histCnt)
-        self.priceChart._calcBBfromHist(data, histCnt)
+        # line up every exchange's history by timestamp (exchanges that were down are missing candles)
+        candles, valid = alignCandles(data)
+        # sometimes Binance trading will be down even when the API is active. Check for volume
+        valid[0] &= np.isnan(candles["buy"][0]) | (candles["v"][0] != 0)
+        candles[~valid] = api.emptyCandles(1)
 
-        exDown = [[] for i in range(numEx)]
-        data = self._checkTimestamps(data, histCnt)
-                    
-        # traverse history from old to new data
-        for i in range(histCnt):
-            # candle data is sorted new->old, so index in reverse order
-            idx = histCnt-1-i
-
-            # Check timestamps to see if an exchange was down during that time
-            self.timestamps.append(max([x[idx][0] for x in data]))
-            invalid = []
-            avgT = sum([x[idx][0] for x in data]) / numEx
-            for j in range(numEx):
-                if not data[j][idx][-1]:
-                    invalid.append(data[j])
-                    exDown[j].append(i)
-            # sometimes Binance trading will be down even when the API is active. Check for volume
-            if len(data[0][idx]) >= 10 and float(data[0][idx][5]) == 0:
-                invalid.append(data[0])
-                exDown[0].append(i)
-
-            tempData = [x[idx] if x not in invalid else [0]*10 for x in data]
-            self.volumeChart.loadHistory(i, tempData)
-            # load an interval of data (one candle/bar) onto price and volume charts
-            tempData = [x[idx] for x in data if x not in invalid]
-            self.priceChart.loadHistory(i, tempData)
-            
+        # consolidate every interval of history at once
+        history = consolidate(candles, valid, self.consolidation)
+
+        exDown = [list(histCnt-1-np.nonzero(~x[:histCnt])[0][::-1]) for x in valid]
+        self.exValid = RingBuffer(shape=(numEx,), dtype=bool, fill=False)
+        self.exValid.extend(valid[:, histCnt-1::-1].T)
+        self.exCandles = RingBuffer(shape=(numEx,), dtype=api.CANDLE_DTYPE)
+        self.exCandles.extend(candles[:, histCnt-1::-1].T)
+        self.timestamps.extend(candles["t"][:, histCnt-1::-1].max(axis=0))
+
+        # load every interval of history onto the price and volume charts
+        self.volumeChart.loadHistory(candles, histCnt)
+        self.priceChart.loadHistory(history, histCnt)
 
         # set axis lims
         self.xlims = [histCnt - self.numCandles, histCnt + self.numCandles]
@@ -1125,9 +1077,9 @@ class CandlestickChart():
         self.volumeChart.initPlot(self.xlims)     
 
         # Load history for indicators and plot data
-        self.oldData = (data, histCnt)
+        self.oldData = (history, histCnt)
         for ind in self.indicators:
-            ind.loadHistory(self.priceChart.ohlc, data, self.volumeChart.vol[0], histCnt)
+            ind.loadHistory(self.priceChart.ohlc, history, self.volumeChart.vol[0], histCnt)
             ind.initPlot(self.currInt)
 
         # draw everything to start
@@ -1143,7 +1095,7 @@ class CandlestickChart():
             ind.update(self.priceChart.ohlc, self.volumeChart.vol[0], self.currInt, retain=False)
 
         # make sure bbands are updated
-        self.priceChart.updateBBands(update=True)
+        self.priceChart.updateBBands()
 
         # update chart limits
         self.currInt += 1
@@ -1159,7 +1111,34 @@ class CandlestickChart():
         self.volumeChart.incCurrIntvl(self.currInt)
 
         # misc updates
-        self.timestamps.append([0])
+        self.timestamps.append(0)
+        self.exValid.append(self.exValid[-1].copy())
+        self.exCandles.append(api.emptyCandles(len(self.exValid[-1])))
+        self.redraw = True
+
+    def backfillExchange(self, ex, candles):
+        # add the candles an exchange missed while it was down (ex is its index in the data)
+        # candles: [(interval index, candle)], each candle is a CANDLE_DTYPE row
+        for idx, candle in candles:
+            if not self.priceChart.ohlc.start <= idx < self.currInt or self.exValid[idx][ex] or float(candle["c"]) == 0:
+                continue
+            # consolidate the interval again with the exchange's candle included
+            self.exCandles[idx][ex] = candle
+            self.exValid[idx][ex] = True
+            new = consolidate(self.exCandles[idx][:, np.newaxis], self.exValid[idx][:, np.newaxis], self.consolidation)[0]
+            self.priceChart.ohlc[idx][1:5] = [new[f] for f in ("o", "h", "l", "c")]
+            self.priceChart.updateCandle(idx)
+            self.priceChart.drawCandlesticks(idx)
+
+            # mix the exchange's buys into the interval's buy ratio
+            total, ratio = self.volumeChart.getVolBar(idx)
+            if not np.isnan(candle["buy"]) and float(candle["v"]) > 0:
+                self.volumeChart.volRatio[idx] = (ratio*total + float(candle["buy"])) / (total + float(candle["v"]))
+
+            # volume bars are stacked, so add the volume to this exchange and every one before it
+            for j in range(ex+1):
+                vol, temp = self.volumeChart.getVolBar(idx, ex=j)
+                self.volumeChart.setVol(j, idx, vol + float(candle["v"]))
         self.redraw = True
 
 
@@ -1258,7 +1237,8 @@ class CandlestickChart():
                   
         self.fullRedraw = True
         
-    def update(self, data):
+    def update(self, data, candle=None):
+        # data: newest candles from each exchange, candle: their consolidated candle (consolidated here if not given)
         # check if settings dialog was recently closed
         if self.settings != None and not self.settings.isActive():
             # add and initialize any new indicators
@@ -1279,13 +1259,18 @@ class CandlestickChart():
             self.settings.update()
 
         # misc updates
-        self.timestamps[-1] = data[0][0][0]
+        self.timestamps[-1] = max([x[0][0] for x in data])
+        self.exValid[-1] = [float(x[0][4]) != 0 for x in data]
+        for j, x in enumerate(data):
+            self.exCandles[-1][j] = tuple(x[0])
 
         # update volume chart
         self.volumeChart.update(data, self.xlims)
 
         # update price chart
-        self.fullRedraw = self.fullRedraw or self.priceChart.update(data, self.xlims)
+        if candle is None:
+            candle = consolidate(self.exCandles[-1][:, np.newaxis], mode=self.consolidation)
+        self.fullRedraw = self.fullRedraw or self.priceChart.update(candle, self.xlims)
 
         # update technical indicators
         self.updateIndicators()
@@ -1301,6 +1286,19 @@ class CandlestickChart():
             mgr.window.state("zoomed")
             mgr.window.focus()
     
+    def needsUpdate(self):
+        # user is interacting with the figure or something is waiting to be redrawn
+        return self.input or self.settings != None or self.fullRedraw or self.redraw or self.resaveBG
+
+    def waitForEvents(self, timeout, wake=True):
+        # handles mouse/keyboard events for up to timeout seconds without drawing anything
+        # (returns as soon as there is user input if wake is set)
+        if self.kill: raise Exception("Figure closed")
+        self.waiting = wake
+        self.fig.canvas.start_event_loop(max(timeout, 0.001))
+        self.waiting = False
+        if self.kill: raise Exception("Figure closed")
+
     def refresh(self, fullRedraw=False):
         t0 = time.time()
         if self.kill: raise Exception("Figure closed")
@@ -1322,6 +1320,7 @@ class CandlestickChart():
             self.redraw = False
             
         self.fig.canvas.flush_events()
+        self.input = False
         t1 = time.time()
         return
         # print timing information
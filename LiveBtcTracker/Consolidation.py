@@ -0,0 +1,178 @@
+import threading
+import numpy as np
+
+import BTC_API as api
+
+MODES = ["mean", "volume", "median", "trimmed"]
+
+def _sortedWeights(values, weights):
+    # sorts each column by value, returns the sorted values and the cumulative weight (0-1) before and after each one
+    order = np.argsort(values, axis=0, kind="stable")
+    values = np.take_along_axis(values, order, axis=0)
+    weights = np.take_along_axis(weights, order, axis=0)
+    total = weights.sum(axis=0)
+    total[total == 0] = 1
+    after = np.cumsum(weights, axis=0) / total
+    before = after - weights / total
+    return values, before, after
+
+def _median(values, weights):
+    # weighted median of each column (first value where half the weight is reached)
+    values, before, after = _sortedWeights(values, weights)
+    idx = np.argmax(after >= 0.5 - 1e-9, axis=0)
+    return np.take_along_axis(values, idx[np.newaxis], axis=0)[0]
+
+def _trimmedMean(values, weights, trim):
+    # weighted mean of each column without the lowest and highest trim fraction of the weight
+    values, before, after = _sortedWeights(values, weights)
+    kept = np.clip(np.minimum(after, 1 - trim) - np.maximum(before, trim), 0, None)
+    total = kept.sum(axis=0)
+    total[total == 0] = 1
+    return (values * kept).sum(axis=0) / total
+
+def _mean(values, weights):
+    total = weights.sum(axis=0)
+    total[total == 0] = 1
+    return (values * weights).sum(axis=0) / total
+
+def consolidate(candles, weights=None, mode="mean", trim=0.2):
+    # Combines the candles of every exchange into one candle per interval
+    # candles: CANDLE_DTYPE array (exchanges x intervals), weights: how much each one counts (0 to skip it)
+    # mode: "mean" averages the open/close and takes the most extreme high/low (same as the chart always has)
+    #       "volume" weights open/high/low/close by each exchange's volume
+    #       "median" and "trimmed" (mean without the top and bottom trim fraction) ignore outliers
+    # returns a CANDLE_DTYPE array with one candle per interval (all zeros where no exchange counted)
+    if weights is None: weights = np.ones(candles.shape)
+    weights = np.where(candles["c"] != 0, weights, 0).astype(np.float64)
+    used = weights > 0
+    out = api.emptyCandles(candles.shape[1])
+    if mode == "volume":
+        vw = weights * candles["v"]
+        # intervals without any volume fall back to the plain weights
+        weights = np.where(vw.sum(axis=0) > 0, vw, weights)
+
+    if mode == "median":
+        fn = _median
+    elif mode == "trimmed":
+        fn = lambda x, w: _trimmedMean(x, w, trim)
+    else:
+        fn = _mean
+    for f in ("o", "h", "l", "c"):
+        out[f] = fn(candles[f], weights)
+    if mode == "mean":
+        out["h"] = np.where(used, candles["h"], -np.inf).max(axis=0)
+        out["l"] = np.where(used, candles["l"], np.inf).min(axis=0)
+    # high/low have to contain open and close
+    out["h"] = np.maximum(out["h"], np.maximum(out["o"], out["c"]))
+    out["l"] = np.minimum(out["l"], np.minimum(out["o"], out["c"]))
+
+    # volume adds up across exchanges
+    up = candles["c"] != 0
+    out["t"] = np.where(used, candles["t"], 0).max(axis=0)
+    out["v"] = np.where(up, candles["v"], 0).sum(axis=0)
+    buy = np.where(up, candles["buy"], np.nan)
+    known = ~np.isnan(buy).all(axis=0)
+    out["buy"][known] = np.nansum(buy[:, known], axis=0)
+
+    # nothing counted in these intervals
+    empty = ~used.any(axis=0)
+    for f in ("t", "o", "h", "l", "c"):
+        out[f][empty] = 0
+    return out
+
+def alignCandles(data, n=None):
+    # Joins the history of every exchange on timestamp (exchanges skip intervals while they are down)
+    # data: list of CANDLE_DTYPE arrays (new->old), n: intervals to align (defaults to the shortest history)
+    # returns (candles, valid): CANDLE_DTYPE array (exchanges x intervals, new->old) and which candles each exchange had
+    numEx = len(data)
+    if n == None: n = min([len(x) for x in data])
+    # newest interval and interval length most exchanges agree on
+    newest = sorted([x["t"][0] for x in data])[numEx // 2]
+    gran = sorted([x["t"][0] - x["t"][1] for x in data])[numEx // 2]
+
+    candles = api.emptyCandles(numEx * n).reshape(numEx, n)
+    valid = np.zeros((numEx, n), dtype=bool)
+    for j, x in enumerate(data):
+        # interval each candle belongs to, candles off the grid or outside the window are dropped
+        offset = newest - x["t"]
+        k = offset // gran
+        keep = (offset % gran == 0) & (k >= 0) & (k < n)
+        # duplicates keep the first (newest) candle
+        k, first = np.unique(k[keep].astype(np.int64), return_index=True)
+        candles[j, k] = x[keep][first]
+        valid[j, k] = True
+    return candles, valid
+
+class CandleConsolidator():
+# Combines every exchange's current candle into one consolidated candle and publishes it as soon as
+# a quorum of exchanges has sent fresh data, so the chart keeps up with the fastest exchanges instead of the slowest
+
+    def __init__(self, numEx, quorum=None, maxAge=5, mode="mean", trim=0.2):
+        self.numEx = numEx
+        self.mode = mode        # how the candles are combined (see consolidate)
+        self.trim = trim
+        self.quorum = quorum if quorum != None else numEx // 2 + 1 # fresh updates needed to publish
+        self.maxAge = maxAge    # seconds an exchange can be late before it's down-weighted (excluded after twice that)
+        self.lock = threading.Lock()
+        self.rows = api.emptyCandles(numEx)     # newest candle from each exchange
+        self.lastUpdate = np.zeros(numEx)       # when each exchange last sent data
+        self.expected = np.zeros(numEx)         # when each exchange should send data next
+        self.down = np.zeros(numEx, dtype=bool) # exchanges that are down and never included
+        self.pending = set()    # exchanges with fresh data since the last publish
+        self.candle = None      # last published consolidated candle (1 row)
+        self.weights = np.zeros(numEx)          # how much each exchange counted in the last publish
+        self.version = 0        # incremented on every publish
+
+    def update(self, i, candles, now, nextUpdate=None):
+        # nextUpdate: when new data from this exchange is expected (e.g. its next poll)
+        with self.lock:
+            self.rows[i] = candles[0]
+            self.lastUpdate[i] = now
+            self.expected[i] = nextUpdate if nextUpdate != None else now
+            self.down[i] = False
+            self.pending.add(i)
+
+    def setDown(self, i):
+        with self.lock:
+            self.down[i] = True
+            self.pending.discard(i)
+
+    def ready(self):
+        # quorum can't be more than the number of exchanges that are up
+        with self.lock:
+            up = self.numEx - int(self.down.sum())
+            return len(self.pending) >= max(1, min(self.quorum, up))
+
+    def _weights(self, now):
+        # full weight while on time, fading out between maxAge and 2*maxAge late
+        late = now - self.expected
+        w = np.clip(2 - late / self.maxAge, 0, 1)
+        up = ~self.down & (self.rows["c"] != 0)
+        w[~up] = 0
+        if w.sum() == 0:
+            # nothing is fresh, use every exchange that's up
+            w = up.astype(np.float64)
+        return w
+
+    def publish(self, now):
+        with self.lock:
+            w = self._weights(now)
+            if w.sum() == 0:
+                return False
+            rows = self.rows.copy()
+            rows["c"][self.down] = 0
+            candle = consolidate(rows[:, np.newaxis], w[:, np.newaxis], self.mode, self.trim)
+
+            self.candle = candle
+            self.weights = w
+            self.version += 1
+            self.pending.clear()
+        return True
+
+    def snapshot(self):
+        # (version, consolidated candle, weight of each exchange)
+        # before the first successful publish the candle is None and every weight is 0
+        with self.lock:
+            candle = self.candle.copy() if self.candle is not None else None
+            weights = self.weights.copy() if self.weights is not None else np.zeros(self.numEx)
+            return self.version, candle, weights
@@ -0,0 +1,363 @@
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import BTC_API as api
+
+class ExchangePoller():
+# Sends every per-tick API request at once and collects whatever finishes in time
+# so one slow exchange can't hold up the update for all the others
+
+    def __init__(self, maxWorkers=8, deadline=0.9):
+        self.pool = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.deadline = deadline    # seconds each request has to respond before the tick is published without it
+        self.pending = {}           # requests from previous ticks that missed their deadline (key -> future)
+        self.lastLatency = {}       # round trip time (s) of the most recent completed request (key -> float)
+
+    def _call(self, fn, args, kwargs):
+        t0 = time.time()
+        ret = fn(*args, **kwargs)
+        return ret, time.time() - t0
+
+    def poll(self, jobs, deadline=None):
+        # jobs: {key: (fn, args, kwargs)}
+        # returns {key: result} for every request that finished before the deadline
+        if deadline == None: deadline = self.deadline
+        futures = {}
+        for key in jobs:
+            # don't stack up requests to an exchange that still hasn't answered the last one
+            if key in self.pending:
+                futures[key] = self.pending.pop(key)
+                continue
+            fn, args, kwargs = jobs[key]
+            futures[key] = self.pool.submit(self._call, fn, args, kwargs)
+
+        wait(list(futures.values()), timeout=deadline)
+
+        results = {}
+        for key, fut in futures.items():
+            if not fut.done():
+                self.pending[key] = fut
+                continue
+            try:
+                results[key], self.lastLatency[key] = fut.result()
+            except Exception as e:
+                print("Request to %s raised an exception: %s" % (key, e))
+                results[key] = None
+        return results
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+        self.pending = {}
+
+def _sameValue(a, b):
+    # NaN (e.g. a candle's unknown buy volume) counts as equal to itself
+    if b is None: return False
+    try:
+        return np.array_equal(a, b, equal_nan=True)
+    except TypeError:
+        return a == b
+
+class PollScheduler():
+# Decides when each exchange should be polled next
+# Learns how often each exchange's data actually changes and polls at about twice that rate,
+# plus a burst of quick polls right after each candle interval starts so new candles show up sooner
+
+    ALPHA = 0.3     # weight of the newest observation in the average time between changes
+
+    def __init__(self, keys, gran, minPeriods=None, basePeriod=1, maxPeriod=30, burstPeriod=0.25, burstTime=5):
+        if minPeriods == None: minPeriods = {}
+        self.gran = gran
+        self.basePeriod = basePeriod    # normal fastest poll rate (seconds)
+        self.maxPeriod = min(maxPeriod, gran / 2) # slowest poll rate, even for data that rarely changes
+        self.burstPeriod = burstPeriod  # poll rate right after a new interval starts
+        self.burstTime = burstTime      # how long (seconds) the burst lasts
+        self.burstUntil = 0
+        self.minPeriods = {k:minPeriods.get(k, 0) for k in keys} # fastest each key can be polled (rate limits)
+        self.changeInterval = {k:basePeriod for k in keys}       # average seconds between data changes
+        self.lastChange = {k:None for k in keys}
+        self.lastValue = {k:None for k in keys}
+        self.nextPoll = {k:0 for k in keys}
+        self.polls = {k:0 for k in keys}
+        self.wasted = {k:0 for k in keys}   # polls that returned the same data as the last one
+
+    def _period(self, key, now):
+        minPd = self.minPeriods[key]
+        # only burst for data that updates in real time (e.g. not coinbase candles)
+        if now < self.burstUntil and self.changeInterval[key] < self.gran:
+            return max(minPd, self.burstPeriod)
+        return min(self.maxPeriod, max(minPd, self.basePeriod, self.changeInterval[key] / 2))
+
+    def due(self, now):
+        return [k for k in self.nextPoll if self.nextPoll[k] <= now]
+
+    def polled(self, key, now):
+        self.polls[key] += 1
+        # schedule from the last due time instead of now so the polling doesn't drift
+        nxt = self.nextPoll[key] + self._period(key, now)
+        if nxt <= now:
+            nxt = now + self._period(key, now)
+        self.nextPoll[key] = nxt
+
+    def defer(self, key, now):
+        # data came from somewhere else (e.g. a stream), check again after a normal period
+        self.nextPoll[key] = now + self._period(key, now)
+
+    def delay(self, key, until):
+        # don't poll before until (e.g. an exchange that is down or out of requests)
+        self.nextPoll[key] = until
+
+    def observe(self, key, value, now):
+        # value is anything comparable that changes when the exchange's data changes
+        if value == None: return
+        if not _sameValue(value, self.lastValue[key]):
+            if self.lastChange[key] != None:
+                dt = now - self.lastChange[key]
+                self.changeInterval[key] = self.ALPHA * dt + (1 - self.ALPHA) * self.changeInterval[key]
+            self.lastChange[key] = now
+            self.lastValue[key] = value
+        else:
+            self.wasted[key] += 1
+            # data hasn't changed in longer than expected, slow down
+            if self.lastChange[key] != None:
+                self.changeInterval[key] = max(self.changeInterval[key], now - self.lastChange[key])
+
+    def startBurst(self, now):
+        self.burstUntil = now + self.burstTime
+        for key in self.nextPoll:
+            if self.changeInterval[key] < self.gran:
+                self.nextPoll[key] = now
+
+    def nextWake(self):
+        return min(self.nextPoll.values()) if self.nextPoll else time.time() + self.basePeriod
+
+class CircuitBreaker():
+# Stops polling an exchange after it fails several times in a row, then probes it again
+# after a backoff that doubles every time the probe fails (closed -> open -> half-open -> closed)
+
+    CLOSED = "closed"       # exchange is healthy and polled normally
+    OPEN = "open"           # exchange is down and isn't polled until the backoff is over
+    HALF_OPEN = "half-open" # backoff is over, one request is let through as a probe
+
+    def __init__(self, threshold=3, baseDelay=5, maxDelay=600):
+        self.threshold = threshold  # consecutive failures before the breaker opens
+        self.baseDelay = baseDelay  # seconds to wait before the first probe
+        self.maxDelay = maxDelay    # longest wait between probes
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0              # failed probes since the breaker opened
+        self.retryAt = 0
+        self.openedAt = None
+        self.probing = False        # the probe was let through and hasn't succeeded or failed yet
+
+    def allow(self, now):
+        # call right before sending a request, only one is allowed while half-open
+        if self.state == self.OPEN and now >= self.retryAt:
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            if self.probing: return False
+            self.probing = True
+        return self.state != self.OPEN
+
+    def success(self, now):
+        # returns True if the exchange was down and is now readmitted
+        wasDown = self.state != self.CLOSED
+        self.state = self.CLOSED
+        self.probing = False
+        self.failures = 0
+        self.trips = 0
+        self.openedAt = None
+        return wasDown
+
+    def failure(self, now):
+        # returns True if this failure opened the breaker
+        if self.state == self.HALF_OPEN:
+            self.trips += 1
+            self._open(now)
+            return False
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= self.threshold:
+            self.openedAt = now
+            self._open(now)
+            return True
+        return False
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.probing = False
+        self.retryAt = now + min(self.maxDelay, self.baseDelay * 2**self.trips)
+
+class TradeAggregator():
+# Builds the current candle (OHLCV and taker buy volume) from individual trades, O(1) work per trade
+# Fed by a trade stream or by polling an exchange's recent trades
+
+    def __init__(self, gran, sequential=False):
+        self.gran = gran
+        self.sequential = sequential    # trade ids go up by one with every trade (see BTC_API.SEQUENTIAL_TRADE_IDS)
+        self.lock = threading.Lock()
+        self.t = None           # start of the interval being built
+        self.o = self.h = self.l = self.c = 0
+        self.v = 0
+        self.buy = 0            # taker buy volume
+        self.complete = False   # every trade since the interval started was seen
+        self.continuous = False # no trades were missed since the last one
+        self.lastId = -1
+        self.prev = None        # the last finished candle
+        self.trades = 0
+
+    def _add(self, t, price, qty, isBuy, tid):
+        if tid != None:
+            if tid <= self.lastId: return
+            self.lastId = tid
+
+        start = api.intervalStart(t, self.gran)
+        if self.t == None or start > self.t:
+            if self.t != None: self.prev = self._candle()
+            # only complete if the trades leading up to this interval were seen too
+            self.complete = self.t != None and self.continuous
+            self.t = start
+            self.o = self.h = self.l = price
+            self.v = 0
+            self.buy = 0
+        elif start < self.t:
+            return  # late trade from an interval that is already finished
+        self.continuous = True
+
+        if price > self.h: self.h = price
+        if price < self.l: self.l = price
+        self.c = price
+        self.v += qty
+        if isBuy: self.buy += qty
+        self.trades += 1
+
+    def _candle(self):
+        candles = api.emptyCandles(1)
+        candles[0] = (self.t, self.o, self.h, self.l, self.c, self.v, self.buy)
+        return candles
+
+    def add(self, t, price, qty, isBuy, tid=None):
+        with self.lock:
+            self._add(t, price, qty, isBuy, tid)
+
+    def addTrades(self, trades):
+        # trades: BTC_API.TRADE_DTYPE array (old->new)
+        if trades is None or len(trades) == 0: return
+        with self.lock:
+            # trades may have been missed in between if the first one isn't the next id
+            # (or, if ids aren't sequential, if none of them were seen before)
+            nextId = self.lastId + 1 if self.sequential else self.lastId
+            if self.lastId >= 0 and trades["id"][0] > nextId:
+                self.continuous = False
+                self.complete = False
+            for tid, t, p, q, isBuy in trades.tolist():
+                self._add(t, p, q, isBuy, tid)
+
+    def breakContinuity(self):
+        # trades may have been missed (e.g. the stream reconnected)
+        with self.lock:
+            self.continuous = False
+            self.complete = False
+
+    def candle(self):
+        # the candle built from trades, only if it saw every trade in the interval
+        with self.lock:
+            if self.t == None or not self.complete: return None
+            return self._candle()
+
+    def annotate(self, candles):
+        # fill in the taker buy volume of the newest candle from the ratio of buys in the trades seen
+        if candles is None or len(candles) == 0: return candles
+        with self.lock:
+            if self.t == None or self.v == 0: return candles
+            row = candles[0]
+            if not np.isnan(row["buy"]) or not row["t"] <= self.t < row["t"] + self.gran:
+                return candles
+            candles = candles.copy()
+            candles[0]["buy"] = row["v"] * self.buy / self.v
+        return candles
+
+class CandleResampler():
+# Builds the current candle of a longer interval from an exchange's shorter candles, O(1) work per update
+# (for intervals the exchange doesn't have, see BTC_API.baseInterval)
+
+    def __init__(self, gran, baseGran):
+        self.gran = gran
+        self.baseGran = baseGran
+        self.t = None           # start of the interval being built
+        self.closed = None      # [open, high, low, volume, buy volume] of the finished shorter candles in it
+        self.cur = None         # newest shorter candle (still updating)
+        self.complete = False   # every shorter candle since the interval started was seen
+
+    def needed(self):
+        # how many shorter candles to request next time
+        if not self.complete:
+            return self.gran // self.baseGran + 1
+        return 2 # the newest one and the one before in case it changed before closing
+
+    def update(self, candles):
+        if candles is None: return
+        # rebuild from scratch when missing candles were requested again
+        if not self.complete: self.t = None
+        for row in candles[np.argsort(candles["t"], kind="stable")]:
+            self._add(row)
+
+    def _add(self, row):
+        start = api.intervalStart(row["t"], self.gran)
+        if self.t == None or start > self.t:
+            self.t = start
+            self.closed = None
+            self.cur = row.copy()
+            self.complete = row["t"] == start
+            return
+        if start < self.t or row["t"] < self.cur["t"]:
+            return
+        if row["t"] > self.cur["t"]:
+            if row["t"] != self.cur["t"] + self.baseGran:
+                self.complete = False   # missed a candle in between
+            c = self.cur
+            if self.closed == None:
+                self.closed = [c["o"], c["h"], c["l"], c["v"], c["buy"]]
+            else:
+                self.closed[1] = max(self.closed[1], c["h"])
+                self.closed[2] = min(self.closed[2], c["l"])
+                self.closed[3] += c["v"]
+                self.closed[4] += c["buy"]
+        self.cur = row.copy()
+
+    def candle(self):
+        if self.t == None: return None
+        c = self.cur
+        candles = api.emptyCandles(1)
+        if self.closed == None:
+            candles[0] = (self.t, c["o"], c["h"], c["l"], c["c"], c["v"], c["buy"])
+        else:
+            o, h, l, v, buy = self.closed
+            candles[0] = (self.t, o, max(h, c["h"]), min(l, c["l"]), c["c"], v + c["v"], buy + c["buy"])
+        return candles
+
+class SnapshotBuffer():
+# Hands the newest data from the data thread to the chart
+# Every publish replaces the snapshot with a new version (the publisher must not change it afterwards),
+# the chart takes the newest one atomically and skips drawing if it already drew that version
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0        # incremented on every publish
+        self.state = None       # newest snapshot (dict)
+        self.events = []        # one-off events since the last take, kept even if their snapshot is skipped
+
+    def publish(self, state, events=()):
+        with self.lock:
+            self.state = state
+            self.events.extend(events)
+            self.version += 1
+            return self.version
+
+    def latest(self):
+        # (version, snapshot, events since the last call)
+        with self.lock:
+            events = self.events
+            self.events = []
+            return self.version, self.state, events
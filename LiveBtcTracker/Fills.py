@@ -0,0 +1,95 @@
+import numpy as np
+import matplotlib.collections as mcoll
+
+import Series
+
+BLOCK = 64  # intervals in each block of a SegmentedFill
+
+def fillPolygons(x, y1, y2, where=None):
+    # polygons filling the area between y1 and y2 (same as fill_between with interpolate=True)
+    # where: "above" only fills where y1 > y2, "below" only where y1 < y2 (None fills everything)
+    x = np.asarray(x, dtype=np.float64)
+    y1 = np.broadcast_to(np.asarray(y1, dtype=np.float64), x.shape)
+    y2 = np.broadcast_to(np.asarray(y2, dtype=np.float64), x.shape)
+    if len(x) < 2: return []
+    if where == None:
+        return [np.concatenate([np.column_stack([x, y1]), np.column_stack([x, y2])[::-1]])]
+
+    d = y1 - y2 if where == "above" else y2 - y1
+    inside = np.concatenate([[0], (d > 0).astype(np.int8), [0]])
+    edges = np.flatnonzero(np.diff(inside))
+    polys = []
+    for i0, i1 in zip(edges[::2], edges[1::2]):
+        # run of points from i0 to i1-1, closed off where it crosses y2 on either side
+        top = [np.column_stack([x[i0:i1], y1[i0:i1]])]
+        bottom = [np.column_stack([x[i0:i1], y2[i0:i1]])[::-1]]
+        if i0 > 0:
+            t = d[i0-1] / (d[i0-1] - d[i0])
+            cross = [[x[i0-1] + t*(x[i0]-x[i0-1]), y2[i0-1] + t*(y2[i0]-y2[i0-1])]]
+            top.insert(0, cross)
+            bottom.append(cross)
+        if i1 < len(x):
+            t = d[i1-1] / (d[i1-1] - d[i1])
+            cross = [[x[i1-1] + t*(x[i1]-x[i1-1]), y2[i1-1] + t*(y2[i1]-y2[i1-1])]]
+            top.append(cross)
+            bottom.insert(0, cross)
+        polys.append(np.concatenate(top + bottom))
+    return polys
+
+class SegmentedFill():
+# Fill between two series (e.g. the upper and lower bbands, or the rsi and a threshold) indexed by interval
+# The fill is split into blocks: a block is built once all of its intervals are closed and doesn't change after that,
+# only the live block (the intervals after the last closed block) is rebuilt, in place, when the data changes
+# Only the blocks in the visible range are drawn
+
+    def __init__(self, ax, y1, y2, where=None, block=BLOCK, **kwargs):
+        self.ax = ax
+        self.y1 = y1            # RingBuffer
+        self.y2 = y2            # RingBuffer or a constant
+        self.where = where      # see fillPolygons
+        self.block = block
+        self.kwargs = kwargs    # passed to each PolyCollection (facecolor etc.)
+        self.visible = True
+        self.blocks = {}        # first interval of each closed block -> its PolyCollection
+        self.closed = (y1.start // block) * block   # first interval of the live block
+        self.live = self._collection([])
+        self.update()
+
+    def _collection(self, polys):
+        coll = mcoll.PolyCollection(polys, **self.kwargs)
+        coll.set_visible(self.visible)
+        self.ax.add_collection(coll, autolim=False)
+        return coll
+
+    def _polygons(self, i0, i1):
+        # polygons of intervals i0 to i1 (inclusive)
+        y2 = self.y2[i0:i1+1] if isinstance(self.y2, Series.RingBuffer) else self.y2
+        return fillPolygons(np.arange(i0, i1+1), self.y1[i0:i1+1], y2, self.where)
+
+    def update(self):
+        # build the blocks that were closed since the last update and rebuild the live block
+        start, n = self.y1.start, len(self.y1)
+        # blocks whose intervals are no longer stored
+        for i in [i for i in self.blocks if i + self.block < start]:
+            self.blocks.pop(i).remove()
+        # a block ends on the first interval of the next one so they join up, the newest interval is live
+        while self.closed + self.block <= n - 2:
+            i = self.closed
+            self.blocks[i] = self._collection(self._polygons(max(i, start), i + self.block))
+            self.closed += self.block
+        self.live.set_verts(self._polygons(max(self.closed, start), n - 1))
+
+    def set_visible(self, flag):
+        self.visible = flag
+        self.live.set_visible(flag)
+        for coll in self.blocks.values():
+            coll.set_visible(flag)
+
+    def draw(self, xlims):
+        # draw the blocks that are in the visible range (xlims)
+        if not self.visible: return
+        for i, coll in self.blocks.items():
+            if i <= xlims[1] and i + self.block >= xlims[0]:
+                self.ax.draw_artist(coll)
+        if self.closed <= xlims[1]:
+            self.ax.draw_artist(self.live)
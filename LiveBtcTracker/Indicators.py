@@ -1,7 +1,12 @@
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from abc import ABC, abstractmethod
 
+import Series
+import Kernels
+import Fills
+
 class Indicator(ABC):
 # abstract Indicator class
 # outlines functions required by indicator classes
@@ -11,6 +16,7 @@ class Indicator(ABC):
         # Make sure the indicator class calls super()
         self.ax = ax
         self.xlims = xlims
+        self.view = Series.ViewRange()  # intervals the lines are given (visible ones plus a margin)
         self.active = False
         self.removeX = ax.text(0,0, "[X]", fontsize=9, color="#9e9e9e")
         
@@ -24,7 +30,7 @@ class Indicator(ABC):
 
     @abstractmethod
     def loadHistory(self, ohlc, data, vol, histCnt):
-        # Calculate the indicator history using history data
+        # Calculate the indicator history using history data (data: consolidated candles, new->old)
         # store data as class attribute
         pass
 
@@ -61,7 +67,7 @@ class MACD(Indicator):
         super(MACD, self).__init__(ax, xlims)
         
         self.macdBars = []
-        self.macd = []
+        self.macd = Series.RingBuffer()
         self.ema1 = 0
         self.ema2 = 0
         self.ema3 = 0
@@ -71,7 +77,7 @@ class MACD(Indicator):
         self.ema1Wt = 2 / (self.ema1pd+1)
         self.ema2Wt = 2 / (self.ema2pd+1)
         self.ema3Wt = 2 / (self.ema3pd+1)
-        self.deriv = []
+        self.deriv = Series.RingBuffer()    # deriv[i] belongs to interval i + deriv_dx
         self.derivLine = None
         self.deriv_dx = 2
         self.green = "#22d615"
@@ -80,44 +86,32 @@ class MACD(Indicator):
         self.ax.set_ylabel("MACD (%d, %d, %d)" % (self.ema2pd, self.ema1pd, self.ema3pd), fontsize=9)      
     
     def initPlot(self, i):
-        self.macdBars = self.ax.bar(range(i+1), self.macd).patches
+        self.macdBars = Series.RingBuffer(dtype=object, fill=None, first=self.macd.start)
+        self.macdBars.extend(self.ax.bar(*self.macd.xy()).patches)
         for bar,v in zip(self.macdBars, self.macd):
             bar.set_height(v)
             if v < 0: bar.set_color(self.red)
             else: bar.set_color(self.green)
-        self.derivLine, = self.ax.plot(range(self.deriv_dx, i+1), self.deriv, "-", c="white", linewidth=0.7)           
+        self.derivLine, = self.ax.plot(*self.deriv.xy(-self.deriv_dx), "-", c="white", linewidth=0.7)           
 
     def calcEMAfromHistory(self, data, histCnt):
-        numEx = len(data)
+        # data: consolidated candles (new->old)
         ema1Start = histCnt + self.ema1pd+self.ema3pd
-        ema2Start = min(ema1Start - (self.ema1pd-self.ema2pd), histCnt + self.ema2pd+self.ema3pd)
-        
+
         # First EMA value is a SMA
-        # calculate SMA for first X intervals of emaX
-        for i in range(self.ema1pd):
-            # price ema 1
-            idx = ema1Start-1-i
-            temp = [float(x[idx][4]) for x in data if x[idx][-1]] # data has been modified so last element is bool classifying its validity
-            self.ema1 += sum(temp) / len(temp)
-            # price ema 2
-            if i < self.ema2pd:
-                idx = ema2Start-1-i
-                self.ema2 += sum(temp) / len(temp)#sum([float(x[idx][4]) for x in data]) / numEx
-            
-        self.ema1 /= self.ema1pd
-        self.ema2 /= self.ema2pd
-        self.ema3 += (self.ema2 - self.ema1)
+        # calculate SMA for first X intervals of emaX (emaX is started from the same prices as ema1)
+        prices = data["c"][ema1Start-1:histCnt+self.ema3pd-1:-1]
+        self.ema1 = prices.mean()
+        self.ema2 = prices[:self.ema2pd].mean()
 
         # calculate SMA of (ema2-ema1)
-        for i in range(self.ema3pd-1,0,-1):
-            idx = histCnt+i
-            temp = [float(x[idx][4]) for x in data if x[idx][-1]]
-            p = sum(temp) / len(temp)
-            # ema = price * ema_weight + prev_ema * (1 - ema_weight)
-            self.ema1 = p * self.ema1Wt + self.ema1 * (1 - self.ema1Wt)
-            self.ema2 = p * self.ema2Wt + self.ema2 * (1 - self.ema2Wt)
-            self.ema3 += (self.ema2 - self.ema1)
-        self.ema3 /= self.ema3pd
+        prices = data["c"][histCnt+self.ema3pd-1:histCnt:-1]
+        ema1 = Kernels.ema(prices, self.ema1Wt, self.ema1)
+        ema2 = Kernels.ema(prices, self.ema2Wt, self.ema2)
+        self.ema3 = ((self.ema2 - self.ema1) + (ema2 - ema1).sum()) / self.ema3pd
+        if len(prices) > 0:
+            self.ema1 = ema1[-1]
+            self.ema2 = ema2[-1]
 
     def loadHistory(self, ohlc, data, vol, histCnt):
         # MACD = EMA_9 of (EMA_12 - EMA_26)
@@ -125,18 +119,19 @@ class MACD(Indicator):
         # calculate EMAs for history data before displayed data
         self.calcEMAfromHistory(data, histCnt)
 
-        for i in range(histCnt):
-            idx = histCnt - i - 1
-            if idx == 0:
-                self.macd.append(0)
-                self.deriv.append(0)
-                continue
-            self.ema1 = ohlc[i][4] * self.ema1Wt + self.ema1 * (1-self.ema1Wt)
-            self.ema2 = ohlc[i][4] * self.ema2Wt + self.ema2 * (1-self.ema2Wt)
-            self.ema3 = (self.ema2-self.ema1) * self.ema3Wt + self.ema3 * (1-self.ema3Wt)
-            self.macd.append((self.ema2-self.ema1) - self.ema3)
-            if i >= self.deriv_dx:
-                self.deriv.append((self.macd[i] - self.macd[i-self.deriv_dx]) / self.deriv_dx)
+        # every interval except the current one (it's filled in by update)
+        prices = ohlc[:histCnt-1][:, 4]
+        ema1 = Kernels.ema(prices, self.ema1Wt, self.ema1)
+        ema2 = Kernels.ema(prices, self.ema2Wt, self.ema2)
+        ema3 = Kernels.ema(ema2 - ema1, self.ema3Wt, self.ema3)
+        macd = np.append((ema2 - ema1) - ema3, 0)
+        self.macd.extend(macd)
+        self.deriv.extend((macd[self.deriv_dx:-1] - macd[:-1-self.deriv_dx]) / self.deriv_dx)
+        self.deriv.append(0)
+        if len(prices) > 0:
+            self.ema1 = ema1[-1]
+            self.ema2 = ema2[-1]
+            self.ema3 = ema3[-1]
 
     def update(self, ohlc, vol, currInt, retain=True):
         tempEMA1 = ohlc[currInt][4] * self.ema1Wt + self.ema1 * (1 - self.ema1Wt)
@@ -154,8 +149,11 @@ class MACD(Indicator):
 
     def addBar(self, i):
         self.macd.append(0)
-        self.macdBars.append(mpatches.Rectangle((i - 0.4, 0), width=0.8, height=0))
-        self.ax.add_patch(self.macdBars[-1])
+        bar = mpatches.Rectangle((i - 0.4, 0), width=0.8, height=0)
+        self.ax.add_patch(bar)
+        # take the oldest bar off the chart once it's no longer kept
+        old = self.macdBars.append(bar)
+        if old is not None: old.remove()
 
     def draw(self, currInt):
         try:
@@ -164,13 +162,13 @@ class MACD(Indicator):
                 self.macdBars[currInt].set_color(self.red)
             else:
                 self.macdBars[currInt].set_color(self.green)
-            self.derivLine.set_data(range(self.deriv_dx,currInt+1), self.deriv)
+            self.derivLine.set_data(*self.deriv.xy(-self.deriv_dx, self.view.get(self.xlims)))
 
             # find min and max values being plotted to set the bounds of the y-axis
-            maxMacd = max(self.macd[max(0, self.xlims[0]):self.xlims[1]])
-            minMacd = min(self.macd[max(0, self.xlims[0]):self.xlims[1]])
-            maxDeriv = max(self.deriv[max(0, self.xlims[0]):self.xlims[1]])
-            minDeriv = min(self.deriv[max(0, self.xlims[0]):self.xlims[1]])
+            maxMacd = self.macd[max(0, self.xlims[0]):self.xlims[1]].max()
+            minMacd = self.macd[max(0, self.xlims[0]):self.xlims[1]].min()
+            maxDeriv = self.deriv[max(0, self.xlims[0]):self.xlims[1]].max()
+            minDeriv = self.deriv[max(0, self.xlims[0]):self.xlims[1]].min()
             maxMacd = max(maxMacd, maxDeriv)
             minMacd = min(minMacd, minDeriv)
             buf = (maxMacd - minMacd) * 0.12
@@ -185,7 +183,7 @@ class MACD(Indicator):
 
     def drawArtists(self, redraw):
         if redraw:
-            idx0 = max(0, self.xlims[0])
+            idx0 = max(self.macdBars.start, self.xlims[0])
             idx1 = min(self.xlims[1]+1, len(self.macdBars)-1)
             for i in range(idx0, idx1):
                 self.ax.draw_artist(self.macdBars[i])        
@@ -201,8 +199,10 @@ class RSI(Indicator):
         
         self.avgGain = 0
         self.avgLoss = 0
-        self.rsi = []
+        self.rsi = Series.RingBuffer()
         self.lastPrice = 0
+        self.deltaSum = 0   # sum of the absolute changes between closed rsi values
+        self.deltaCnt = 0   # number of changes in deltaSum
         self.xlims = xlims
         self.rsiPlot = None
         self.hiThresh = None
@@ -214,77 +214,52 @@ class RSI(Indicator):
         self.ax.set_ylim(0, 100)
 
     def initPlot(self, i):
-        self.rsiPlot, = self.ax.plot(range(i+1), self.rsi, "-", c="yellow", linewidth=0.9) 
+        self.rsiPlot, = self.ax.plot(*self.rsi.xy(), "-", c="yellow", linewidth=0.9) 
         self.hiThresh, = self.ax.plot(self.xlims, [70,70], "--", c="white", linewidth=0.5)
         self.loThresh, = self.ax.plot(self.xlims, [30,30], "--", c="white", linewidth=0.5)
         self.rsiText = self.ax.text(0, 0, "", fontsize=9, color="#cecece")
 
         # fill areas that are overbought or oversold
-        yhi = [70]*len(self.rsi)
-        ylo = [30]*len(self.rsi)
-        overbought = [y1 > y2 for y1,y2 in zip(self.rsi, yhi)]
-        oversold = [y1 < y2 for y1,y2 in zip(self.rsi, ylo)]
-        self.over_fill.append(self.ax.fill_between(range(i+1), self.rsi, yhi, where=overbought, facecolor="red", interpolate=True))
-        self.over_fill.append(self.ax.fill_between(range(i+1), self.rsi, ylo, where=oversold, facecolor="blue", interpolate=True))
+        self.over_fill.append(Fills.SegmentedFill(self.ax, self.rsi, 70, where="above", facecolor="red"))
+        self.over_fill.append(Fills.SegmentedFill(self.ax, self.rsi, 30, where="below", facecolor="blue"))
       
     def loadHistory(self, ohlc, data, vol, histCnt):
         #                        100
         # RSI = 100  -   --------------------
         #               (1 + avgGain/avgLoss)
         #
-        # calculate rsi for history data that occurs before the displayed data
-        n = min([len(d) for d in data]) #(data[0])
-        for i in range(n - histCnt):
-            idx = n-i-1
-            temp = [float(x[idx][1]) for x in data if x[idx][-1]] # data has been modified so last element is bool classifying the validity
-            tempOpen = sum(temp) / len(temp)
-            temp = [float(x[idx][4]) for x in data if x[idx][-1]]
-            tempClose = sum(temp) / len(temp)
-            diff = tempClose - tempOpen
-            # find average of first 14 periods
-            if i < 14:
-                if diff < 0:
-                    self.avgLoss -= diff
-                else:
-                    self.avgGain += diff
-                if i == 13:
-                    self.avgGain /= 14
-                    self.avgLoss /= 14
-            # remaining periods = (prev_avg * 13 + current_diff) / 14
-            else:
-                if diff < 0:
-                    self.avgLoss = (self.avgLoss * 13 - diff)
-                    self.avgGain *= 13
-                else:
-                    self.avgGain = (self.avgGain * 13 + diff)
-                    self.avgLoss *= 13
-                self.avgGain /= 14
-                self.avgLoss /= 14
-        self.rsi.append(100 - (100 / (1 + (self.avgGain / self.avgLoss))))
-
-        # calculate rsi for every interval of displayed data
-        for i in range(len(ohlc)-1):
-            diff = ohlc[i][4] - ohlc[i][1]
-            if diff < 0:
-                self.avgLoss = (self.avgLoss * 13 - diff)
-                self.avgGain *= 13
-            else:
-                self.avgGain = (self.avgGain * 13 + diff)
-                self.avgLoss *= 13
-            self.avgGain /= 14
-            self.avgLoss /= 14
-            self.rsi.append(100 - (100 / (1 + (self.avgGain / self.avgLoss))))
+        # calculate rsi for history data that occurs before the displayed data (data is the consolidated candles, new->old)
+        diff = (data["c"] - data["o"])[:histCnt-1:-1]
+        # find average of first 14 periods
+        self.avgGain = np.maximum(diff[:14], 0).mean()
+        self.avgLoss = np.maximum(-diff[:14], 0).mean()
+        # then for every interval of displayed data (except the current one)
+        diff = np.append(diff[14:], ohlc[:len(ohlc)-1][:, 4] - ohlc[:len(ohlc)-1][:, 1])
+
+        # remaining periods = (prev_avg * 13 + current_diff) / 14
+        gains = Kernels.wilder(np.maximum(diff, 0), 14, self.avgGain)
+        losses = Kernels.wilder(np.maximum(-diff, 0), 14, self.avgLoss)
+        n = len(diff) - len(ohlc[:len(ohlc)-1])
+        gains = np.append(self.avgGain, gains)[n:]
+        losses = np.append(self.avgLoss, losses)[n:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.rsi.extend(100 - (100 / (1 + (gains / losses))))
+        self.avgGain = gains[-1]
+        self.avgLoss = losses[-1]
+
+        # the newest rsi value is still live
+        closed = self.rsi.values()[:-1]
+        self.deltaSum = np.abs(np.diff(closed)).sum()
+        self.deltaCnt = max(len(closed) - 1, 0)
 
     def resetRSItime(self):
         gains = self.avgGain
         losses = self.avgLoss
         startRSI = self.rsi[-1]
-        expectedTime = 0
 
-        avgDiff = 0
-        for i in range(1, len(self.rsi)):
-            avgDiff += abs(self.rsi[i] - self.rsi[i-1])
-        avgDiff /= (len(self.rsi) - 1)
+        # average change of the rsi per interval (including the live one)
+        avgDiff = (self.deltaSum + abs(startRSI - self.rsi[-2])) / (self.deltaCnt + 1)
+        if avgDiff == 0: return 0, 0
         candles = int(abs(startRSI - 50) / avgDiff + 0.5)
 
         lastDiff = startRSI-self.rsi[-2]
@@ -313,21 +288,6 @@ class RSI(Indicator):
                 gains = tempG
         return candles, gainOrLoss
 
-        tempRSI = startRSI
-        while (tempRSI > 50 and startRSI > 50) or (tempRSI < 50 and startRSI < 50):
-            if startRSI < 50:
-                gains = (gains * 13 + avgDiff) / 14
-                losses = losses * 13 / 14
-                tempRSI += avgDiff
-            elif startRSI > 50:
-                gains = gains * 13 / 14
-                losses = (losses * 13 + avgDiff) / 14
-                tempRSI -= avgDiff
-            #tempRSI = 100 - (100 / (1 + (gains / losses)))
-            expectedTime += 1
-
-        return expectedTime    
-
     def update(self, ohlc, vol, currInt, retain=True):
         tempGain = 0
         tempLoss = 0
@@ -345,11 +305,17 @@ class RSI(Indicator):
         if not retain:
             self.avgGain = tempGain
             self.avgLoss = tempLoss
-            self.rsi.append(0)
+            # the live value is closed, keep its change and forget the one that's no longer stored
+            self.deltaSum += abs(self.rsi[-1] - self.rsi[-2])
+            self.deltaCnt += 1
+            dropped = self.rsi.append(0)
+            if dropped is not None:
+                self.deltaSum -= abs(self.rsi[self.rsi.start] - dropped)
+                self.deltaCnt -= 1
 
     def draw(self, currInt):
         rsit, dp = self.resetRSItime()
-        self.rsiPlot.set_data(range(currInt+1), self.rsi)
+        self.rsiPlot.set_data(*self.rsi.xy(lims=self.view.get(self.xlims)))
         self.hiThresh.set_xdata(self.xlims)
         self.loThresh.set_xdata(self.xlims)
         self.rsiText.set_text("%.2f, %d, %.2f" % (self.rsi[-1], rsit, self.lastPrice+dp))
@@ -359,24 +325,16 @@ class RSI(Indicator):
         else: self.removeX.set_text("")
         self.removeX.set_position(((self.xlims[1] - self.xlims[0])*0.97 + self.xlims[0], 5))
 
-        # fill areas that are overbought or oversold
-        if self.rsi[currInt] < 30: 
-            ylo = [30]*len(self.rsi)
-            oversold = [y1 < y2 for y1,y2 in zip(self.rsi, ylo)]
-            self.over_fill[1].remove()
-            self.over_fill[1] = self.ax.fill_between(range(currInt+1), self.rsi, ylo, where=oversold, facecolor="blue", interpolate=True)
-        elif self.rsi[currInt] > 70:
-            yhi = [70]*len(self.rsi)
-            overbought = [y1 > y2 for y1,y2 in zip(self.rsi, yhi)]
-            self.over_fill[0].remove()
-            self.over_fill[0] = self.ax.fill_between(range(currInt+1), self.rsi, yhi, where=overbought, facecolor="red", interpolate=True)
+        # fill areas that are overbought or oversold (only the newest intervals are rebuilt)
+        for fill in self.over_fill:
+            fill.update()
 
     def drawArtists(self, redraw):
         if redraw:
             self.ax.draw_artist(self.hiThresh)
             self.ax.draw_artist(self.loThresh)
-            self.ax.draw_artist(self.over_fill[0])
-            self.ax.draw_artist(self.over_fill[1])
+            for fill in self.over_fill:
+                fill.draw(self.xlims)
         else:
             self.ax.draw_artist(self.rsiPlot)
             self.ax.draw_artist(self.rsiText)
@@ -386,32 +344,25 @@ class OBV(Indicator):
     def __init__(self, ax, xlims):
         super(OBV, self).__init__(ax, xlims)
         
-        self.obv = []
+        self.obv = Series.RingBuffer()
         self.obvPlt = None
 
         self.ax.set_ylabel("OBV", fontsize=8)
         self.ax.set_yticklabels([])
         
     def initPlot(self, i):
-        self.obvPlt, = self.ax.plot(range(i+1), self.obv, "-", linewidth=0.9)
+        self.obvPlt, = self.ax.plot(*self.obv.xy(), "-", linewidth=0.9)
         self.ax.set_ylim(
-            min(self.obv[max(self.xlims[0], 0):min(len(self.obv), self.xlims[1])]),
-            max(self.obv[max(self.xlims[0], 0):min(len(self.obv), self.xlims[1])]))
+            self.obv[max(self.xlims[0], 0):min(len(self.obv), self.xlims[1])].min(),
+            self.obv[max(self.xlims[0], 0):min(len(self.obv), self.xlims[1])].max())
 
     def loadHistory(self, ohlc, data, vol, histCnt):
         # OBV = prev_OBV - Volume     if red candle
         #        or
         # OBV = prevOBV + Volume      if green candle
-        self.obv.append(0)
-        for p,v in zip(ohlc, vol):
-            temp = self.obv[-1]
-            if p[4] > p[1]:
-                self.obv.append(temp+v)
-            elif p[4] < p[1]:
-                self.obv.append(temp-v)
-            else:
-                self.obv.append(temp)
-        self.obv = self.obv[1:]
+        n = min(len(ohlc.values()), len(vol.values()))
+        self.obv = Series.RingBuffer(first=ohlc.start)
+        self.obv.extend(Kernels.obv(ohlc.values()[:n, 1], ohlc.values()[:n, 4], vol.values()[:n]))
 
     def update(self, ohlc, vol, currInt, retain=True):
         if ohlc[currInt][4] > ohlc[currInt][1]:
@@ -425,10 +376,10 @@ class OBV(Indicator):
             self.obv.append(0)
 
     def draw(self, currInt):
-        self.obvPlt.set_data(range(currInt+1), self.obv)
+        self.obvPlt.set_data(*self.obv.xy(lims=self.view.get(self.xlims)))
         
-        minOBV = min(self.obv[max(0, self.xlims[0]):min(len(self.obv), self.xlims[1])])
-        maxOBV = max(self.obv[max(0, self.xlims[0]):min(len(self.obv), self.xlims[1])])
+        minOBV = self.obv[max(0, self.xlims[0]):min(len(self.obv), self.xlims[1])].min()
+        maxOBV = self.obv[max(0, self.xlims[0]):min(len(self.obv), self.xlims[1])].max()
         buf = (maxOBV - minOBV) * 0.1
         self.ax.set_ylim(minOBV-buf, maxOBV+buf)
         
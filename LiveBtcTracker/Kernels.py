@@ -0,0 +1,39 @@
+import numpy as np
+
+# Vectorized versions of the indicator calculations, used to load a whole history at once
+# Each indicator's update() carries on from the last value these return
+
+def ema(x, alpha, init):
+    # y[i] = alpha*x[i] + (1-alpha)*y[i-1], with y[-1] = init
+    # y[i] = decay^(i+1) * (init + alpha * sum(x[k] / decay^(k+1))) is worked out in blocks
+    # short enough that 1/decay^k doesn't lose precision
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty(len(x))
+    decay = 1 - alpha
+    if decay <= 0:
+        out[:] = x
+        return out
+    block = max(1, int(np.log(1e3) / -np.log(decay))) if decay < 1 else len(x)
+    prev = init
+    for i in range(0, len(x), block):
+        chunk = x[i:i+block]
+        p = decay ** np.arange(1, len(chunk)+1)
+        out[i:i+len(chunk)] = p * (prev + alpha * np.cumsum(chunk / p))
+        prev = out[i+len(chunk)-1]
+    return out
+
+def wilder(x, period, init):
+    # Wilder's smoothing: y[i] = (y[i-1] * (period-1) + x[i]) / period
+    return ema(x, 1 / period, init)
+
+def rollingMean(x, period):
+    # mean of every window of period values (len(x)-period+1 of them)
+    return np.lib.stride_tricks.sliding_window_view(np.asarray(x, dtype=np.float64), period).mean(axis=1)
+
+def rollingStd(x, period):
+    # (population) standard deviation of every window of period values
+    return np.lib.stride_tricks.sliding_window_view(np.asarray(x, dtype=np.float64), period).std(axis=1)
+
+def obv(opens, closes, vol, init=0):
+    # on-balance volume: volume is added on green candles and subtracted on red ones
+    return init + np.cumsum(np.sign(np.asarray(closes) - np.asarray(opens)) * vol)
@@ -3,53 +3,180 @@ import threading
 import argparse
 import os
 import ctypes
+import numpy as np
 from datetime import datetime, timedelta
 
 from CandlestickChart import CandlestickChart
 from Configuration import DefaultConfig
+from CandleCache import CandleCache, SymbolCatalog
+from Consolidation import CandleConsolidator, MODES
 import BTC_API as api
+import DataFeed
+import Startup
+import Streams
 
 def retrieveData():
-    global lastBfx
     global cbpPrice
     global exchanges
     global numEx
     global candleData
     global useCBP
-    global rdy
 
-    failures = [0]*numEx
+    # exchanges that keep failing are skipped until a backoff is over, then probed and readmitted
+    breakers = {ex:DataFeed.CircuitBreaker() for ex in exchanges}
+    lastGood = [d[0][0] for d in candleData]    # newest candle each exchange had before it went down
+    tInt = checkTimeInterval(0)
+
+    # streams push updates as they happen, REST is only used for exchanges whose stream is down
+    streamUpdate = threading.Event()
+    streams = Streams.startStreams(exchanges, INTERVAL, SYMBOL, notify=streamUpdate) if STREAM else {}
+
+    # trades give the buy/sell split of every exchange's volume (and coinbase's candle without its lag)
+    aggregators = {ex:streams[ex].trades for ex in streams}
+    if TRADES:
+        for ex in exchanges:
+            if ex not in aggregators: aggregators[ex] = DataFeed.TradeAggregator(granularity, ex in api.SEQUENTIAL_TRADE_IDS)
+    tradeKeys = ["trades:"+ex for ex in aggregators] if TRADES else []
+
+    # exchanges that don't have the interval build it from a shorter interval's candles
+    resamplers = {}
+    for ex in exchanges:
+        base = api.baseInterval(ex, INTERVAL)
+        if base != INTERVAL:
+            resamplers[ex] = DataFeed.CandleResampler(granularity, api.granFromInterv(base))
+
+    poller = DataFeed.ExchangePoller(maxWorkers=numEx+len(tradeKeys)+1)
+    # poll each exchange as often as its data actually changes (and its rate limit allows)
+    minPeriods = {ex:1/api.getLimiter(ex, "candles").rate for ex in exchanges}
+    # only poll the coinbase ticker if coinbase is tracked
+    tickerKeys = ["cbpTicker"] if "coinbasepro" in exchanges else []
+    for key in tickerKeys:
+        minPeriods[key] = 1/api.getLimiter("coinbasepro", "ticker").rate
+    for key in tradeKeys:
+        minPeriods[key] = 1/api.getLimiter(key[7:], "trades").rate
+    scheduler = DataFeed.PollScheduler(exchanges + tickerKeys + tradeKeys, granularity, minPeriods)
     if run: print("success")
     else: print("failed")
     
     while run:
         ti = time.time()
 
-        # Get CoinbasePro live ticker price
-        if useCBP:
-            cbpPrice = api.liveTicker("coinbasepro", SYMBOL)
+        # send a burst of polls as soon as a new interval starts so the new candle shows up quickly
+        t1 = checkTimeInterval(tInt)
+        if t1 != tInt:
+            tInt = t1
+            scheduler.startBurst(ti)
+        due = scheduler.due(ti)
+
+        # Take the latest data from every stream that is up
+        streamUpdate.clear()
+        streamed = {}
+        for ex in streams:
+            # a stream only has the newest shorter candle, so a resampled interval is polled until it has all of them
+            # (coinbase only streams its ticker, its candles are always polled)
+            if ex != "coinbasepro" and ex in resamplers and not resamplers[ex].complete: continue
+            if not streams[ex].isLive(ti) or not breakers[ex].allow(ti): continue
+            candle, price = streams[ex].snapshot()
+            if ex == "coinbasepro":
+                streamed["cbpTicker"] = {"price":price}
+            else:
+                streamed[ex] = candle
+        for key in streamed:
+            scheduler.defer(key, ti)
+        # trades only need polling for exchanges whose stream is down
+        for key in tradeKeys:
+            if key[7:] in streams and streams[key[7:]].isLive(ti):
+                scheduler.defer(key, ti)
+
+        # Queue up every request that is due so they can all be sent at once
+        jobs = {}
+        if useCBP and "cbpTicker" in due and "cbpTicker" not in streamed:
+            # Get CoinbasePro live ticker price
+            jobs["cbpTicker"] = (api.liveTicker, ("coinbasepro", SYMBOL), {})
+        for i in range(numEx):
+            if exchanges[i] not in due or exchanges[i] in streamed:
+                continue
+            # skip exchanges that are out of requests until their rate limit refills (e.g. bitfinex every 3 seconds)
+            wait = api.requestDelay(exchanges[i], "candles")
+            if wait > 0:
+                scheduler.delay(exchanges[i], ti + wait)
+                continue
+            # exchanges that are down wait until their backoff is over, then send one probe
+            # (a probe that missed its deadline is still collected)
+            if not breakers[exchanges[i]].allow(ti) and exchanges[i] not in poller.pending:
+                if breakers[exchanges[i]].state == DataFeed.CircuitBreaker.OPEN:
+                    scheduler.delay(exchanges[i], breakers[exchanges[i]].retryAt)
+                continue
+            if exchanges[i] in resamplers:
+                base = api.baseInterval(exchanges[i], INTERVAL)
+                jobs[exchanges[i]] = (api.getCandle, (exchanges[i], base, SYMBOL, resamplers[exchanges[i]].needed()), {})
+            else:
+                jobs[exchanges[i]] = (api.getCandle, (exchanges[i], INTERVAL, SYMBOL), {})
+        for key in tradeKeys:
+            ex = key[7:]
+            if key not in due or (ex in streams and streams[ex].isLive(ti)):
+                continue
+            # trades are only polled while the exchange is up (its candles are the probe)
+            if breakers[ex].state == DataFeed.CircuitBreaker.OPEN:
+                scheduler.delay(key, breakers[ex].retryAt)
+                continue
+            wait = api.requestDelay(ex, "trades")
+            if wait > 0:
+                scheduler.delay(key, ti + wait)
+            elif breakers[ex].state == DataFeed.CircuitBreaker.CLOSED:
+                jobs[key] = (api.recentTrades, (ex, SYMBOL), {})
+        for key in jobs:
+            scheduler.polled(key, ti)
+        # anything else that was due is skipped this time, check it again after a normal period
+        for key in due:
+            if key not in jobs and key not in streamed:
+                scheduler.defer(key, ti)
+
+        # Publish the tick with whatever arrived before the deadline
+        results = poller.poll(jobs) if jobs else {}
+        results.update(streamed)
+
+        for key in tradeKeys:
+            if key in results and results[key] is not None and len(results[key]) > 0:
+                aggregators[key[7:]].addTrades(results[key])
+                scheduler.observe(key, results[key]["id"][-1], time.time())
+
+        tripped = []
+        fresh = []  # exchanges that sent data this tick
+        backfills = [] # (exchange index, candles) for exchanges that came back after being down
+        if "cbpTicker" in results:
+            cbpPrice = results["cbpTicker"]
             if cbpPrice == None:
                 cbpPrice = {"price":0}
-                failures[-1] += 1
+                if breakers["coinbasepro"].failure(ti): tripped.append(exchanges.index("coinbasepro"))
+            else:
+                scheduler.observe("cbpTicker", cbpPrice["price"], time.time())
                 
         # Get candle data from each exchange        
         for i in range(numEx):
-            # bitfinex api is rate limited to every 3 seconds
-            if (exchanges[i] == "bitfinex" and time.time() - lastBfx < 3):
+            # still waiting on this exchange, try again next tick
+            if exchanges[i] not in results:
                 continue
-
-            temp = api.getCandle(exchanges[i], INTERVAL, SYMBOL)
-            if exchanges[i] == "bitfinex": lastBfx = time.time()
+            temp = results[exchanges[i]]
+            if temp is not None and len(temp) == 0: temp = None
+            if exchanges[i] in resamplers and temp is not None:
+                resamplers[exchanges[i]].update(temp)
+                temp = resamplers[exchanges[i]].candle()
+            if exchanges[i] in aggregators: temp = aggregators[exchanges[i]].annotate(temp)
+            if temp is not None: scheduler.observe(exchanges[i], tuple(temp[0]), time.time())
             
             # Check if latest data was retrievable
             if not isCandleUpdated(exchanges[i], temp):
-                failures[i] += 1
-                if failures[i] == 3:
-                    ts_fail = time.strftime("%m/%d %H:%M:%S", time.localtime(ti))
-                    print("%s - Stopping requests to %s (Restart to try again)" % (ts_fail, exchanges[i]))
+                if breakers[exchanges[i]].failure(ti) and i not in tripped: tripped.append(i)
                 temp = [0]*6
+            elif breakers[exchanges[i]].success(ti):
+                # exchange is back up, get the candles it missed
+                ts_up = time.strftime("%m/%d %H:%M:%S", time.localtime(ti))
+                print("%s - %s is back up" % (ts_up, exchanges[i]))
+                candleData[i] = getMissedCandles(i, lastGood[i], temp, tInt)
+                backfills.append((i, candleData[i]))
+                fresh.append(i)
             else:
-                failures[i] = 0
                 if exchanges[i] == "coinbasepro":
                     candleData[i][0][1] = temp[0][1]
                     candleData[i][0][2] = max(candleData[i][0][2], float(cbpPrice["price"]))
@@ -57,20 +184,79 @@ def retrieveData():
                     if cbpPrice["price"] != 0: candleData[i][0][4] = float(cbpPrice["price"])
                 else:
                     candleData[i] = temp
+                fresh.append(i)
                              
-        # Check if any exchange failed three times in a row
-        if 3 in failures:
-            exchanges = [ex for ex,f in zip(exchanges, failures) if f < 3]
-            candleData = [d for d,f in zip(candleData, failures) if f < 3]
-            failures = [f for f in failures if f < 3]  
-            numEx = len(exchanges)
-            useCBP = ("coinbasepro" in exchanges)
-
-        rdy = True
-        tf = time.time()
-        time.sleep(max(0.01, 1-(tf-ti)))
+        # coinbase candles lag by 3-5 minutes, use the one built from its trades once a full interval was seen
+        if useCBP and "coinbasepro" in aggregators:
+            i = exchanges.index("coinbasepro")
+            tc = aggregators["coinbasepro"].candle()
+            if tc is not None and tc[0][0] > candleData[i][0][0]:
+                # shift the rows down in place (the oldest is dropped) so the array doesn't keep growing
+                candleData[i][1:] = candleData[i][:-1].copy()
+                candleData[i][0] = tc[0]
+            elif tc is not None and tc[0][0] == candleData[i][0][0]:
+                candleData[i][0] = tc[0]
+
+        # the ticker alone is enough to keep coinbase's price fresh
+        if useCBP and results.get("cbpTicker") != None and cbpPrice["price"] != 0:
+            i = exchanges.index("coinbasepro")
+            if i not in fresh and candleData[i][0][4] != 0:
+                candleData[i][0][2] = max(candleData[i][0][2], float(cbpPrice["price"]))
+                candleData[i][0][3] = min(candleData[i][0][3], float(cbpPrice["price"]))
+                candleData[i][0][4] = float(cbpPrice["price"])
+                fresh.append(i)
+
+        # Stop requests to any exchange that failed three times in a row until its backoff is over
+        for i in tripped:
+            ts_fail = time.strftime("%m/%d %H:%M:%S", time.localtime(ti))
+            print("%s - %s is down, retrying in %ds" % (ts_fail, exchanges[i], breakers[exchanges[i]].retryAt - ti))
+            lastGood[i] = candleData[i][0][0]
+            candleData[i] = api.emptyCandles(1)
+            consolidator.setDown(i)
+        useCBP = ("coinbasepro" in exchanges and breakers["coinbasepro"].state == DataFeed.CircuitBreaker.CLOSED)
+
+        # publish a new consolidated candle once enough exchanges have sent fresh data
+        for i in fresh:
+            if i in tripped: continue
+            nextUpdate = scheduler.nextPoll[exchanges[i]]
+            if exchanges[i] == "coinbasepro": nextUpdate = min(nextUpdate, scheduler.nextPoll["cbpTicker"])
+            consolidator.update(i, candleData[i], ti, nextUpdate)
+        published = consolidator.ready() and consolidator.publish(ti)
+        if published or backfills: publishSnapshot(backfills)
+
+        # sleep until the next poll is due, the next interval starts or a stream has new data
+        wake = min(scheduler.nextWake(), tInt + granularity)
+        if streams:
+            streamUpdate.wait(max(0.01, wake - time.time()))
+        else:
+            time.sleep(max(0.01, wake - time.time()))
+    poller.shutdown()
+    if streams: print("Streams:")
+    for ex in streams:
+        streams[ex].stop()
+        print("\t%s stream: %d messages, %d connects" % (ex, streams[ex].messages, streams[ex].connects))
+
+    # report how many polls came back with data that hadn't changed
+    print("Polls (unchanged):")
+    for key in scheduler.polls:
+        print("\t%s: %d (%d)" % (key, scheduler.polls[key], scheduler.wasted[key]))
     print("ended")
 
+def publishSnapshot(backfills=()):
+    # hand a copy of the newest data to the chart (candleData keeps changing in the data thread)
+    version, candle, weights = consolidator.snapshot()
+    state = {"candleData":[x.copy() for x in candleData], "candle":candle, "weights":weights,
+             "useCBP":useCBP, "numEx":numEx}
+    return snapshots.publish(state, backfills)
+
+def getMissedCandles(i, lastT, temp, t):
+    # fetch every candle since the exchange's last good one, in the same format as the history
+    missing = int((t - lastT) / granularity) + 2
+    hist = api.getCandle(exchanges[i], INTERVAL, SYMBOL, missing)
+    if hist is None or len(hist) == 0:
+        hist = temp
+    return correctData(hist, exchanges[i], t)
+
 def secondsToString(time_s):
     timeStr = ""
     if time_s >= 86400:
@@ -100,7 +286,7 @@ def adjustCBPdata(candleData, chart, t):
             for i in range(past):
                 # calculate the difference in time intervals
                 diff = int((t - candleData[-1][i][0]) / granularity)
-                if chart.currInt >= diff: # must check in case candleData time is 0
+                if chart.currInt - diff >= chart.priceChart.ohlc.start: # must check in case candleData time is 0 (or too old to still be kept)
                     idx = chart.currInt - diff
                     # for each candle, subtract the old vol and add the updated value
                     for j in range(numEx-1):
@@ -124,7 +310,7 @@ def checkTimeInterval(t):
 
 def isCandleUpdated(ex, data):
     tnow = time.time()
-    if data == None or\
+    if data is None or\
         (ex != "coinbasepro" and\
         data[0][0] < (tnow - granularity) and\
         (tnow % granularity) > 30):
@@ -134,18 +320,13 @@ def isCandleUpdated(ex, data):
 
 # ----- These functions are generally only run once ----- #
 def filterDupes(data):
-    filtered = []
-    lastT = 0
-    for d in data:
-        if lastT == d[0]:
-            continue
-        lastT = d[0]
-        filtered.append(d)
-    return filtered
+    # drop candles with the same timestamp as the one before it
+    keep = np.ones(len(data), dtype=bool)
+    keep[1:] = data["t"][1:] != data["t"][:-1]
+    return data[keep]
 
 def adjustTimestamps(data, amt):
-    for d in data:
-        d[0] += amt
+    data["t"] += amt
     return data
 
 def correctData(data, ex, tnow):
@@ -155,8 +336,9 @@ def correctData(data, ex, tnow):
 
     elif ex == "coinbasepro":
         # shift coinbasepro data until it's "up-to-date"
-        while data[0][0] != tnow:
-            data = [[data[0][0] + granularity, data[0][4], data[0][4], data[0][4], data[0][4], 0]] + data
+        behind = int((tnow - data[0][0]) / granularity)
+        if behind > 0:
+            data = np.concatenate([api.flatCandle(tnow, data[0][4], behind, granularity), data])
         
     elif ex == "gemini":
         # gemini duplicates timestamps during downtime
@@ -171,8 +353,8 @@ def correctData(data, ex, tnow):
         elif INTERVAL == "1d":
             data = adjustTimestamps(data, -14400)
             
-    # okex is based on Hong Kong time
-    elif ex == "okex":
+    # okex is based on Hong Kong time (resampled candles are already UTC)
+    elif ex == "okex" and api.validInterval(ex, INTERVAL):
         isdst = time.localtime().tm_isdst > 0
         if INTERVAL == "6h":
             dt = datetime.fromtimestamp(data[-1][0])
@@ -195,10 +377,77 @@ def correctData(data, ex, tnow):
                 
     # shift data in case application was launched soon after new interval start
     if tnow - granularity <= data[0][0] < tnow:
-        data = [[data[0][0] + granularity, data[0][4], data[0][4], data[0][4], data[0][4], 0]] + data
+        data = np.concatenate([api.flatCandle(data[0][0] + granularity, data[0][4]), data])
     return data
 
-def loadInitData(chart, HISTORY, t):
+def validateExchange(ex):
+    base = api.baseInterval(ex, INTERVAL)
+    if base == None:
+        print("WARNING: %s is not a valid interval for the exchange %s" % (INTERVAL, ex))
+        print("\tThis exchange will not be included in tracking")
+        return False
+    if base != INTERVAL:
+        print("%s doesn't have the %s interval, building it from %s candles" % (ex, INTERVAL, base))
+    if not api.isValidSymbol(ex, SYMBOL, catalog=catalog):
+        print("WARNING: %s cannot be traded for USD or USDT on %s" % (SYMBOL, ex))
+        print("\tThis exchange will not be included in tracking")
+        return False
+    return True
+
+def parseDailyVol(ex, stats):
+    if stats == None:
+        return None
+    if ex == "binance": return float(stats["volume"])
+    elif ex == "bitfinex": return float(stats[0]["volume"])
+    elif ex == "coinbasepro": return float(stats["volume"])
+    elif ex == "gemini": return float(stats["volume"][SYMBOL])
+    elif ex == "okex": return float(stats["base_volume_24h"])
+    return None
+
+def runStartup(chart):
+    global exchanges
+    global numEx
+    global useCBP
+
+    # Validation, 24hr stats and history don't depend on each other, so request them all at once
+    # history for an exchange only waits on that exchange being validated
+    histPlusEMAPd = HISTORY + chart.historyNeeded()
+    pipeline = Startup.StartupPipeline()
+    for ex in exchanges:
+        pipeline.add("validate:"+ex, validateExchange, (ex,), phase="validation")
+        pipeline.add("history:"+ex, api.getCandle, (ex, INTERVAL, SYMBOL, histPlusEMAPd), {"cache":cache},
+                     deps=["validate:"+ex], phase="history")
+    for ex in ["bitfinex", "binance", "coinbasepro", "gemini", "okex"]:
+        pipeline.add("24hr:"+ex, api.getDailyVol, (ex, SYMBOL), phase="24hr stats")
+    results = pipeline.run()
+
+    # Remove exchanges that didn't pass validation
+    for ex in exchanges[:]:
+        if not results["validate:"+ex]:
+            del CONF["legend"][exchanges.index(ex)]
+            exchanges.remove(ex)
+    numEx = len(exchanges)
+    useCBP = ("coinbasepro" in exchanges)
+
+    # ---------- 24hr ---------- #
+    dailyVol = {}
+    for ex in ["bitfinex", "binance", "coinbasepro", "gemini", "okex"]:
+        vol = parseDailyVol(ex, results["24hr:"+ex])
+        if vol != None: dailyVol[ex] = vol
+    totVol = sum(dailyVol.values())
+
+    # ---------- Print info ---------- #
+    print("\nTracking %sUSD on %d exchanges on the %s interval" % (SYMBOL, numEx, INTERVAL))
+    print("Data sources: ", exchanges)
+    print("Break down volume bars by exchange: %s" % str(VOL_BREAK_DOWN))
+    print("24 hour volume: %f %s" % (totVol, SYMBOL))
+    for ex in dailyVol:
+        print("\t%s: %d (%.1f%%)" % (EX_NAMES[ex], dailyVol[ex], dailyVol[ex] / totVol * 100))
+    pipeline.report()
+
+    return {ex:results["history:"+ex] for ex in exchanges}
+
+def loadInitData(chart, HISTORY, t, history):
     global candleData
     global numEx
     global exchanges
@@ -208,8 +457,8 @@ def loadInitData(chart, HISTORY, t):
     failed = []
     histPlusEMAPd = HISTORY + chart.historyNeeded()#26 + 9 # account for EMA26 and SMA9 of the EMA26 and EMA12 for MACD
     for i in range(numEx):
-        # retrieve history of candle data
-        temp = api.getCandle(exchanges[i], INTERVAL, SYMBOL, histPlusEMAPd)
+        # history of candle data (retrieved during startup)
+        temp = history.get(exchanges[i])
 
         # failed to retrieve data from a specific exchange
         if temp is None:
@@ -220,13 +469,11 @@ def loadInitData(chart, HISTORY, t):
         if len(temp) < histPlusEMAPd:
             print("WARNING: could only retrieve %d intervals of history for %s" % (len(temp), exchanges[i]))
             HISTORY -= histPlusEMAPd - len(temp)
-            histPlusEMAPd = HISTORY + 26 + 9
+            histPlusEMAPd = HISTORY + chart.historyNeeded()
 
         # Correct the retrieved data (typically timestamps) and add it to the candleData
         temp = correctData(temp, exchanges[i], t)     
         candleData.append(temp)
-       
-    lastBfx = time.time()
 
     # Remove any exchanges that we failed to retrieve data from
     for f in failed:
@@ -300,12 +547,11 @@ def getDefaultConfig():
 
 def main():
     global run
-    global lastBfx
     global candleData
     global exchanges
     global numEx
     global HISTORY
-    global rdy
+    global consolidator
 
     # ---------- PREPARE TRACKER ---------- #
     # Create chart object that controls all matplotlib related functionality
@@ -320,8 +566,19 @@ def main():
     if granularity == 604800:
         t -= 86400*3            # subtract three days to get the nearest past Mon 00:00:00 UTC
 
-    # Get some history and current candle to start
-    loadInitData(chart, HISTORY, t)
+    # Validate exchanges and get some history and current candle to start
+    history = runStartup(chart)
+    if numEx == 0:
+        print("ERROR: No exchanges are available to communicate with. Quitting...")
+        return
+    loadInitData(chart, HISTORY, t, history)
+
+    # combines the exchanges' candles, starting from the ones that were just loaded
+    consolidator = CandleConsolidator(numEx, QUORUM, mode=CONF["consolidation"])
+    for i in range(numEx):
+        if float(candleData[i][0][4]) != 0: consolidator.update(i, candleData[i], time.time())
+    consolidator.publish(time.time())
+    publishSnapshot()
 
     # Start separate thread for API calls (they're slow)
     print("Starting data retrieval thread...", end='')
@@ -330,36 +587,79 @@ def main():
 
     # ---------- START TRACKER ---------- #
     # Loop to constantly update the current time interval candle and volume bar
+    price = 0
+    drawn = 0       # version of the data that was last drawn
+    title = ""
+    frameTime = 1 / MAX_FPS
+    lastFrame = 0
+    usage = {"idle":[0, 0], "active":[0, 0]} # [cpu seconds, seconds] spent in each mode
+    last = (time.time(), time.process_time())
     while True:
+        # keep track of how much CPU time is used while idling and while active
+        now = (time.time(), time.process_time())
+        mode = "idle" if chart.enableIdle and not chart.active else "active"
+        usage[mode][0] += now[1] - last[1]
+        usage[mode][1] += now[0] - last[0]
+        last = now
 
-        if chart.enableIdle and not rdy and not chart.active:
-            time.sleep(0.01)
-            continue
-        else:
-            rdy = False
+        try:
+            # at most MAX_FPS frames per second, user input is still handled in the meantime
+            rest = lastFrame + frameTime - time.time()
+            if rest > 0: chart.waitForEvents(rest, wake=False)
+
+            # take the newest data from the data thread
+            version, snap, backfills = snapshots.latest()
+
+            # check for new interval
+            t1 = checkTimeInterval(t)
+            newInterval = t != t1
+
+            # nothing changed since the last frame (only the time left in the title if not idling)
+            timeLeft = secondsToString(t1+granularity-time.time())
+            changed = version != drawn or newInterval or backfills or chart.needsUpdate()
+            if not changed and (chart.enableIdle or timeLeft == title):
+                # sleep until there's user input or it's time to check for new data again
+                chart.waitForEvents(frameTime)
+                continue
+        except Exception as ex:
+            if str(ex) != "Figure closed": print(ex)
+            break
+        lastFrame = time.time()
+        title = timeLeft
 
-        # check for new interval
-        t1 = checkTimeInterval(t)
-        if t != t1:
+        if newInterval:
             t = t1
             chart.incCurrIntvl()
 
-        if numEx == 0:
+        # add the intervals that an exchange missed while it was down
+        for i, missed in backfills:
+            try:
+                candles = []
+                for candle in missed:
+                    diff = int((t - candle["t"]) / granularity)
+                    if 0 < diff <= chart.currInt:
+                        candles.append((chart.currInt - diff, candle))
+                chart.backfillExchange(i, candles)
+            except Exception as ex:
+                print("Could not backfill %s: %s" % (exchanges[i], ex))
+
+        if snap["numEx"] == 0:
             print("No exchanges are available to communicate with. Quitting...")
             break
 
         # Adjust for CBP as needed
-        if useCBP: adjustCBPdata(candleData, chart, t)
+        if snap["useCBP"]: adjustCBPdata(snap["candleData"], chart, t)
 
-        # average price from all exchanges (should weight by volume?)
-        price = sum([float(x[0][4]) for x in candleData]) / numEx
+        # price from the newest consolidated candle
+        candle = snap["candle"]
+        if candle is not None: price = float(candle[0]["c"])
 
         # set chart title as "<Current Price> <Time interval> <Time left in candle>"
-        timeLeft = secondsToString(t+granularity-time.time())
         chart.setTitle("$%.2f (%s - %s)" % (price, INTERVAL, timeLeft))
 
         # update all charts with the newest data
-        chart.update(candleData)
+        chart.update(snap["candleData"], candle)
+        drawn = version
 
         try:
             chart.refresh()
@@ -372,6 +672,20 @@ def main():
     run = False
     thrd.join()
 
+    print("CPU time per hour:")
+    for mode in usage:
+        if usage[mode][1] > 0:
+            print("\t%s: %.1fs (%.1f minutes measured)" % (mode, usage[mode][0] * 3600 / usage[mode][1], usage[mode][1] / 60))
+
+    # Report how many requests were able to reuse an open connection
+    print("Connection reuse:")
+    for host, stats in api.connectionStats().items():
+        print("\t%s: %d requests, %d new connections, %d reused" % (host, stats["requests"], stats["new"], stats["reused"]))
+    print("Rate limit usage:")
+    for (ex, endpoint), stats in api.rateLimitUsage().items():
+        print("\t%s/%s: %d requests, %.1fs spent waiting" % (ex, endpoint, stats["requests"], stats["waited"]))
+    api.closeSessions()
+
 
 if __name__ == "__main__":
     # ---------- Parse CL Args ---------- #
@@ -383,6 +697,14 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--symbol", help="The ticker symbol of the coin you want to watch (defaults to BTC)", required=False, default="BTC")
     parser.add_argument("--idle", help="Update the chart much less often", action="store_true")
     parser.add_argument("--fullscreen", help="Launch the application in fullscreen mode", action="store_true")
+    parser.add_argument("--no_cache", help="Download all history at start instead of using the local candle cache", action="store_true")
+    parser.add_argument("--stream", help="Get live data from exchange WebSocket feeds instead of polling (falls back to polling)", action="store_true")
+    parser.add_argument("--trades", help="Poll recent trades to get the buy/sell volume of every exchange", action="store_true")
+    parser.add_argument("--quorum", help="How many exchanges need fresh data before the chart updates (defaults to a majority)", required=False, type=int, default=None)
+    parser.add_argument("--bb_period", help="Number of intervals the Bollinger Bands are calculated from", required=False, type=int, default=20)
+    parser.add_argument("--bb_stdev", help="Distance of the upper/lower Bollinger Bands from the mean, in standard deviations", required=False, type=float, default=2)
+    parser.add_argument("--fps", help="Maximum number of times per second the chart is redrawn", required=False, type=float, default=10)
+    parser.add_argument("--consolidation", help="How prices from the exchanges are combined: mean, volume (weighted), median or trimmed (mean)", required=False, choices=MODES, default="mean")
     args = vars(parser.parse_args())
 
 
@@ -393,6 +715,11 @@ if __name__ == "__main__":
     SYMBOL = args["symbol"].upper()         # the ticker symbol of the asset being tracked
     IS_IDLE = args["idle"]                  # chart only updates when get new data for all exchanges OR user is active on the GUI
     IS_FULLSCREEN = args["fullscreen"]
+    USE_CACHE = not args["no_cache"]        # only download history newer than what is stored locally
+    STREAM = args["stream"]                 # live updates come from WebSocket streams
+    TRADES = args["trades"]                 # buy/sell volume for every exchange from its recent trades
+    QUORUM = args["quorum"]                 # fresh exchange updates needed to publish a new consolidated candle
+    MAX_FPS = max(args["fps"], 0.1)         # maximum frame rate of the chart
     
     # Load default parameters
     CONF = getDefaultConfig()
@@ -408,11 +735,15 @@ if __name__ == "__main__":
         IS_IDLE = CONF["enableIdle"]
     else:
         CONF["enableIdle"] = True
+    CONF["consolidation"] = args["consolidation"]
+    CONF["bbPeriod"] = max(args["bb_period"], 2)
+    CONF["bbStdev"] = args["bb_stdev"]
     
     exchanges = ["binance", "okex", "bitfinex", "gemini", "coinbasepro"] # Binance must be first, CBP must be last
     numEx = len(exchanges)
     granularity = api.granFromInterv(INTERVAL)
-    CONF["legend"] = ["Binance", "OKEx", "Bitfinex", "Gemini", "CoinbasePro"]   
+    EX_NAMES = {"binance":"Binance", "okex":"OKEx", "bitfinex":"Bitfinex", "gemini":"Gemini", "coinbasepro":"CoinbasePro"}
+    CONF["legend"] = [EX_NAMES[ex] for ex in exchanges]
     
     # --- arg checks --- #
     if IS_FULLSCREEN:
@@ -427,75 +758,19 @@ if __name__ == "__main__":
         print("WARNING: Cannot retrieve more than 1405 intervals of history")
         HISTORY = 1405
 
-    if not api.validInterval("binance", INTERVAL):
+    if api.baseInterval("binance", INTERVAL) == None:
         print("WARNING: %s is not a valid interval" % INTERVAL)
         print("\tDefaulting to %s" % CONF["timeFrame"])
         INTERVAL = CONF["timeFrame"]
         granularity = api.granFromInterv(INTERVAL)
         
-    tempEx = exchanges[:]
-    for ex in tempEx:
-        if not api.validInterval(ex, INTERVAL):
-            print("WARNING: %s is not a valid interval for the exchange %s" % (INTERVAL, ex))
-            print("\tThis exchange will not be included in tracking")
-            del CONF["legend"][exchanges.index(ex)]
-            exchanges.remove(ex)
-            numEx -= 1
-        elif not api.isValidSymbol(ex, SYMBOL):
-            print("WARNING: %s cannot be traded for USD or USDT on %s" % (SYMBOL, ex))
-            print("\tThis exchange will not be included in tracking")
-            del CONF["legend"][exchanges.index(ex)]
-            exchanges.remove(ex)
-            numEx -= 1
-            
-    useCBP = ("coinbasepro" in exchanges)
-    if numEx == 0:
-        print("ERROR: No exchanges are available to communicate with. Quitting...")
-        exit()
-
-
-    # ---------- 24hr ---------- #
-    bfxStats = api.getDailyVol("bitfinex",SYMBOL)
-    #stampStats = api.getDailyVol("bitstamp")
-    binStats = api.getDailyVol("binance", SYMBOL)
-    cbpStats = api.getDailyVol("coinbasepro", SYMBOL)
-    gemStats = api.getDailyVol("gemini", SYMBOL)
-    okStats = api.getDailyVol("okex", SYMBOL)
-
-    totVol = 0
-    if bfxStats != None:
-        bfxVol = float(bfxStats[0]["volume"])
-        totVol += bfxVol
-    #totVol += float(stampStats["volume"])
-    if binStats != None:
-        binVol = float(binStats["volume"])
-        totVol += binVol
-    if cbpStats != None:
-        cbpVol = float(cbpStats["volume"])
-        totVol += cbpVol
-    if gemStats != None:
-        gemVol = float(gemStats["volume"][SYMBOL])
-        totVol += gemVol
-    if okStats != None:
-        okVol = float(okStats["base_volume_24h"])
-        totVol += okVol
-
-    # ---------- Print info ---------- #
-    print("\nTracking %sUSD on %d exchanges on the %s interval" % (SYMBOL, numEx, INTERVAL))
-    print("Data sources: ", exchanges)
-    print("Break down volume bars by exchange: %s" % str(VOL_BREAK_DOWN))
-    print("24 hour volume: %f %s" % (totVol, SYMBOL))
-    if bfxStats != None: print("\tBitfinex: %d (%.1f%%)" % (bfxVol, bfxVol / totVol * 100))
-    if binStats != None: print("\tBinance: %d (%.1f%%)" % (binVol, binVol / totVol * 100))
-    if cbpStats != None: print("\tCoinbasePro: %d (%.1f%%)" % (cbpVol, cbpVol / totVol * 100))
-    if gemStats != None: print("\tGemini: %d (%.1f%%)" % (gemVol, gemVol / totVol * 100))
-    if okStats != None: print("\tOKEx: %d (%.1f%%)" % (okVol, okVol / totVol * 100))
-
     # global variable used between threads
     run = True              # flag for running data retreival thread
-    lastBfx = 0             # finex has a lower rate limit, keep track of last call
     candleData = []         # TOHLCV candlestick data for each exchange
     cbpPrice = {"price":0}  # keep track of real-time CBP price - candlestick API doesn't update as often
-    rdy = False
+    consolidator = None     # consolidated candle from all exchanges, updated by the data thread
+    snapshots = DataFeed.SnapshotBuffer() # newest data handed from the data thread to the chart
+    cache = CandleCache() if USE_CACHE else None
+    catalog = SymbolCatalog() if USE_CACHE else None
     
     main()
@@ -0,0 +1,264 @@
+import numpy as np
+
+CAPACITY = 2880     # intervals kept in memory by default (two days of 1m candles), older ones are dropped
+VIEW_MARGIN = 10    # intervals plotted past each side of the visible ones
+
+class RingBuffer():
+# Fixed-capacity series indexed by absolute interval (like a list that only keeps its newest values)
+# Appending is O(1) (amortized) and every slice is a view into one contiguous array, never a copy:
+# values are stored in an array twice the capacity and the newest half is moved to the front when it fills up
+
+    def __init__(self, shape=(), dtype=np.float64, fill=0, capacity=None, first=0):
+        self.capacity = capacity if capacity != None else CAPACITY
+        capacity = self.capacity
+        self.data = np.full((2*capacity,) + tuple(shape), fill, dtype=dtype)
+        self.n = first  # absolute index of the next value appended (first: index of the first one)
+        self.off = first    # absolute index of data[0]
+
+    @property
+    def start(self):
+        # oldest absolute index that can still be accessed
+        return max(self.off, self.n - self.capacity)
+
+    def __len__(self):
+        return self.n
+
+    def append(self, value):
+        # returns the value that no longer fits (None if nothing was dropped) so e.g. its artist can be removed
+        dropped = None
+        if self.n - self.capacity >= self.off:
+            dropped = self.data[self.n - self.capacity - self.off]
+            if isinstance(dropped, np.ndarray): dropped = dropped.copy()
+        if self.n - self.off == len(self.data):
+            # out of room, keep the newest capacity values
+            self.data[:self.capacity] = self.data[self.capacity:]
+            self.off += self.capacity
+        self.data[self.n - self.off] = value
+        self.n += 1
+        return dropped
+
+    def extend(self, values):
+        # copies values in blocks (values that get dropped aren't returned)
+        values = np.asarray(values, dtype=self.data.dtype)
+        i = 0
+        while i < len(values):
+            if self.n - self.off == len(self.data):
+                self.data[:self.capacity] = self.data[self.capacity:]
+                self.off += self.capacity
+            k = min(len(values) - i, len(self.data) - (self.n - self.off))
+            self.data[self.n - self.off:self.n - self.off + k] = values[i:i+k]
+            self.n += k
+            i += k
+
+    def _index(self, i):
+        if i < 0: i += self.n
+        if not self.start <= i < self.n:
+            raise IndexError("index %d is not in the buffer (%d to %d)" % (i, self.start, self.n-1))
+        return i - self.off
+
+    def _slice(self, s):
+        # absolute (list-like) slice -> slice of the stored array, clipped to what is still stored
+        i0, i1, step = s.indices(self.n)
+        i0 = max(i0, self.start)
+        i1 = max(i1, i0)
+        return slice(i0 - self.off, i1 - self.off, step)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.data[self._slice(i)]
+        return self.data[self._index(i)]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            self.data[self._slice(i)] = value
+        else:
+            self.data[self._index(i)] = value
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def values(self):
+        # view of everything still stored (oldest to newest)
+        return self.data[self.start - self.off:self.n - self.off]
+
+    def xy(self, offset=0, lims=None):
+        # x (interval) and y values for plotting, value i belongs to interval i - offset
+        # lims: first and last interval to include (e.g. from a ViewRange), everything that's stored if None
+        i0 = max(self.start, offset)
+        i1 = self.n
+        if lims != None:
+            i0 = max(i0, lims[0] + offset)
+            i1 = max(min(i1, lims[1] + offset + 1), i0)
+        return np.arange(i0 - offset, i1 - offset), self.data[i0 - self.off:i1 - self.off]
+
+class ViewRange():
+# Intervals a line needs to be given to be drawn: the visible ones (xlims) plus a margin on each side
+# Lines only get the values in this range, so updating them costs the same however long the chart has been running
+
+    def __init__(self, margin=VIEW_MARGIN):
+        self.margin = margin
+        self.xlims = None
+        self.lims = None
+
+    def get(self, xlims):
+        # (first, last) interval, only recalculated when xlims change
+        if self.xlims != (xlims[0], xlims[1]):
+            self.xlims = (xlims[0], xlims[1])
+            self.lims = (xlims[0] - self.margin, xlims[1] + self.margin)
+        return self.lims
+
+class RollingWindow():
+# Mean and standard deviation of the newest period values, O(1) to add or change a value
+# Keeps a running sum and sum of squares (compensated, and relative to a reference value so squaring
+# large prices doesn't cancel out), the values themselves are kept in a fixed ring so the oldest can be taken back out
+
+    def __init__(self, period, values=()):
+        self.period = period
+        self.ring = np.zeros(period)
+        self.pos = 0            # where the next value goes
+        self.count = 0          # values in the window (up to period)
+        self.pushes = 0         # values added since the sums were last recalculated
+        self.ref = 0.0          # values are summed relative to this
+        self.sums = np.zeros(4) # [sum, its compensation, sum of squares, its compensation]
+        for v in values:
+            self.push(v)
+
+    def _add(self, i, x):
+        # Neumaier compensated summation into sums[i] (compensation is in sums[i+1])
+        s = self.sums[i]
+        t = s + x
+        if abs(s) >= abs(x):
+            self.sums[i+1] += (s - t) + x
+        else:
+            self.sums[i+1] += (x - t) + s
+        self.sums[i] = t
+
+    def _change(self, old, new):
+        old -= self.ref
+        new -= self.ref
+        self._add(0, new - old)
+        self._add(2, new*new - old*old)
+
+    def _resync(self):
+        # recalculate the sums exactly around the current mean once every value in the window was replaced
+        values = self.values()
+        self.ref = values.mean() if len(values) > 0 else 0.0
+        d = values - self.ref
+        self.sums[:] = [d.sum(), 0, (d*d).sum(), 0]
+        self.pushes = 0
+
+    def push(self, x):
+        # add a new value (the oldest one leaves the window once it's full)
+        if self.count == self.period:
+            self._change(self.ring[self.pos], x)
+        else:
+            self._change(self.ref, x)
+            self.count += 1
+        self.ring[self.pos] = x
+        self.pos = (self.pos + 1) % self.period
+        self.pushes += 1
+        if self.pushes >= self.period: self._resync()
+
+    def replace(self, x):
+        # change the newest value (e.g. the close of the live candle)
+        if self.count == 0: return self.push(x)
+        i = (self.pos - 1) % self.period
+        self._change(self.ring[i], x)
+        self.ring[i] = x
+
+    def values(self):
+        # oldest to newest
+        if self.count < self.period: return self.ring[:self.count]
+        return np.roll(self.ring, -self.pos)
+
+    def mean(self):
+        if self.count == 0: return 0.0
+        return self.ref + (self.sums[0] + self.sums[1]) / self.count
+
+    def std(self):
+        # population standard deviation
+        if self.count == 0: return 0.0
+        m = (self.sums[0] + self.sums[1]) / self.count
+        return max((self.sums[2] + self.sums[3]) / self.count - m*m, 0) ** 0.5
+
+class RangeIndex():
+# Index and value of the highest (or lowest) value in any range of a series in O(1), using a sparse table:
+# level k holds the index of the best value among the 2^k values starting at each index
+# Only closed values are in the table (closing one is O(log n)), the live value is compared separately so updating it is O(1)
+
+    def __init__(self, highest=True, capacity=None):
+        self.highest = highest      # find the highest value (lowest if False)
+        self.capacity = capacity
+        self.values = RingBuffer(capacity=capacity) # closed values
+        self.levels = []            # RingBuffer of indexes for each level of the table
+        self.live = None            # (index, value) of the live value
+        self.dirty = False          # a closed value changed, the table has to be rebuilt
+
+    def _best(self, i, j):
+        # index with the better value (the later one if they're equal)
+        a, b = self.values[i], self.values[j]
+        if a == b: return max(i, j)
+        return i if (a > b) == self.highest else j
+
+    def load(self, values, first=0):
+        self.values = RingBuffer(capacity=self.capacity, first=first)
+        self.values.extend(values)
+        self._rebuild()
+
+    def _rebuild(self):
+        vals = self.values.values()
+        first = self.values.start
+        cur = np.arange(len(vals))
+        self.levels = []
+        k = 0
+        while len(cur) > 0:
+            level = RingBuffer(dtype=np.int64, capacity=self.capacity, first=first)
+            level.extend(cur + first)
+            self.levels.append(level)
+            # best of two neighbouring blocks (the later one if they're equal)
+            half = 1 << k
+            left, right = cur[:-half], cur[half:]
+            better = vals[right] >= vals[left] if self.highest else vals[right] <= vals[left]
+            cur = np.where(better, right, left)
+            k += 1
+        self.dirty = False
+
+    def close(self, value):
+        # add a value that won't change anymore (normally the live one once its interval is over)
+        self.values.append(value)
+        n = len(self.values)
+        if len(self.levels) == 0:
+            self.levels.append(RingBuffer(dtype=np.int64, capacity=self.capacity, first=n-1))
+        self.levels[0].append(n-1)
+        # the blocks that end with the new value
+        k = 1
+        while n - (1 << k) >= self.levels[0].start:
+            i = n - (1 << k)
+            if k == len(self.levels):
+                self.levels.append(RingBuffer(dtype=np.int64, capacity=self.capacity, first=i))
+            half = 1 << (k-1)
+            self.levels[k].append(self._best(self.levels[k-1][i], self.levels[k-1][i+half]))
+            k += 1
+
+    def setLive(self, index, value):
+        self.live = (index, value)
+
+    def update(self, index, value):
+        # change a closed value (rare, the table is rebuilt on the next query)
+        self.values[index] = value
+        self.dirty = True
+
+    def query(self, i0, i1):
+        # (index, value) of the best value from i0 to i1 (inclusive), (None, None) if there are none
+        if self.dirty: self._rebuild()
+        best = None
+        i0 = int(max(i0, self.values.start))
+        j1 = int(min(i1, len(self.values)-1))
+        if i0 <= j1:
+            k = (j1 - i0 + 1).bit_length() - 1
+            best = self._best(self.levels[k][i0], self.levels[k][j1 - (1 << k) + 1])
+        value = self.values[best] if best != None else None
+        if self.live != None and i0 <= self.live[0] <= i1:
+            if best == None or self.live[1] == value or (self.live[1] > value) == self.highest:
+                best, value = self.live
+        return best, value
@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class StartupPipeline():
+# Runs the independent network steps needed at startup concurrently as a dependency graph
+# A task only runs once every task it depends on has finished with a truthy result
+
+    def __init__(self, maxWorkers=16):
+        self.maxWorkers = maxWorkers
+        self.tasks = {}         # name -> (fn, args, kwargs, deps, phase)
+        self.order = []         # task names in the order they were added
+        self.results = {}       # name -> return value (None if skipped or raised)
+        self.times = {}         # name -> (start, end) epoch seconds
+        self.skipped = []       # tasks that didn't run because a dependency failed
+        self.startTime = 0
+        self.endTime = 0
+
+    def add(self, name, fn, args=(), kwargs=None, deps=(), phase=None):
+        if kwargs == None: kwargs = {}
+        if phase == None: phase = name
+        self.tasks[name] = (fn, args, kwargs, list(deps), phase)
+        self.order.append(name)
+
+    def _timed(self, name, fn, args, kwargs):
+        t0 = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.times[name] = (t0, time.time())
+
+    def run(self):
+        self.startTime = time.time()
+        waiting = self.order[:]
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while waiting or running:
+                # start every task whose dependencies are done, skip ones whose dependencies failed
+                for name in waiting[:]:
+                    deps = self.tasks[name][3]
+                    if any([d in self.results and not self.results[d] for d in deps]):
+                        self.results[name] = None
+                        self.skipped.append(name)
+                        waiting.remove(name)
+                    elif all([d in self.results for d in deps]):
+                        fn, args, kwargs = self.tasks[name][:3]
+                        running[pool.submit(self._timed, name, fn, args, kwargs)] = name
+                        waiting.remove(name)
+
+                # nothing left that can run (remaining tasks depend on ones that will never finish)
+                if not running:
+                    for name in waiting:
+                        self.results[name] = None
+                        self.skipped.append(name)
+                    break
+                done, temp = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        self.results[name] = fut.result()
+                    except Exception as e:
+                        print("Startup step %s failed: %s" % (name, e))
+                        self.results[name] = None
+
+        self.endTime = time.time()
+        return self.results
+
+    def phaseTimes(self):
+        # {phase: seconds from the first task in the phase starting to the last one finishing}
+        spans = {}
+        for name in self.order:
+            if name not in self.times: continue
+            phase = self.tasks[name][4]
+            t0, t1 = self.times[name]
+            if phase in spans:
+                spans[phase] = (min(spans[phase][0], t0), max(spans[phase][1], t1))
+            else:
+                spans[phase] = (t0, t1)
+        return {phase:t1-t0 for phase,(t0,t1) in spans.items()}
+
+    def report(self):
+        print("Startup timing:")
+        for phase, secs in self.phaseTimes().items():
+            print("\t%s: %.2fs" % (phase, secs))
+        print("\ttotal: %.2fs" % (self.endTime - self.startTime))
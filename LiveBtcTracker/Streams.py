@@ -0,0 +1,237 @@
+import json
+import time
+import zlib
+import threading
+import numpy as np
+
+import BTC_API as api
+import DataFeed
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+STREAM_URLS = {
+    "binance":"wss://stream.binance.com:9443/stream?streams={coin}usdt@kline_{tint}/{coin}usdt@aggTrade",
+    "bitfinex":"wss://api-pub.bitfinex.com/ws/2",
+    "coinbasepro":"wss://ws-feed.pro.coinbase.com",
+    "gemini":"wss://api.gemini.com/v2/marketdata",
+    "okex":"wss://real.okex.com:8443/ws/v3",
+}
+
+def available():
+    return websocket != None
+
+class ExchangeStream():
+# Keeps one exchange's current candle and last trade price up to date from its WebSocket feed
+# (kline/candle channel for OHLCV, trade channel so the price moves as soon as a trade happens
+# and so the buy/sell split of the volume is known for every exchange)
+
+    def __init__(self, ex, tint, COIN="BTC", url=None, notify=None, staleAfter=10, tradeGran=None):
+        self.ex = ex
+        self.tint = tint
+        self.gran = api.granFromInterv(tint)
+        self.coin = COIN
+        self.url = url if url != None else STREAM_URLS[ex].format(coin=COIN.lower(), tint=tint)
+        self.notify = notify            # threading.Event set whenever new data arrives
+        self.staleAfter = staleAfter    # seconds without a message before the stream is considered down
+        self.hasCandles = ex != "coinbasepro" # coinbase has no candle channel, its candle is built from trades
+
+        self.candle = None              # newest candle (1 row, same format as BTC_API.getCandle)
+        self.price = None               # price of the last trade
+        self.connected = False
+        self.lastMsg = 0
+        self.messages = 0
+        self.connects = 0
+        self.channels = {}              # bitfinex channel id -> channel name
+        # trades are grouped by the tracked interval, which can be longer than tint if it gets resampled
+        self.trades = DataFeed.TradeAggregator(tradeGran if tradeGran != None else self.gran, ex in api.SEQUENTIAL_TRADE_IDS)
+        self.lock = threading.Lock()
+        self.running = False
+        self.ws = None
+        self.thread = None
+
+    # ----- Connection ----- #
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.ws != None: self.ws.close()
+        if self.thread != None: self.thread.join(timeout=2)
+
+    def _run(self):
+        delay = 1
+        while self.running:
+            self.ws = websocket.WebSocketApp(self.url,
+                                             on_open=self._onOpen,
+                                             on_message=self._onMessage,
+                                             on_error=self._onError,
+                                             on_close=self._onClose)
+            self.ws.run_forever(ping_interval=20, ping_timeout=10)
+            self.connected = False
+            if not self.running: break
+            # reconnect with a backoff, REST fills in until then
+            time.sleep(delay)
+            delay = min(delay*2, 30)
+            if self.messages > 0: delay = 1
+
+    def _onOpen(self, ws):
+        self.connected = True
+        self.connects += 1
+        self.channels = {}
+        # trades were missed while disconnected
+        self.trades.breakContinuity()
+        for msg in self._subscriptions():
+            ws.send(json.dumps(msg))
+
+    def _onError(self, ws, err):
+        ts = time.strftime("%m/%d %H:%M:%S", time.localtime(time.time()))
+        print("%s - %s stream error: %s" % (ts, self.ex, err))
+
+    def _onClose(self, ws, *args):
+        self.connected = False
+
+    def _onMessage(self, ws, msg):
+        # okex compresses every message
+        if isinstance(msg, bytes):
+            msg = zlib.decompress(msg, -zlib.MAX_WBITS)
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            return
+        with self.lock:
+            updated = self._parse(data)
+            self.lastMsg = time.time()
+            self.messages += 1
+        if updated and self.notify != None:
+            self.notify.set()
+
+    # ----- State ----- #
+    def isLive(self, now=None):
+        if now == None: now = time.time()
+        if not self.connected or now - self.lastMsg > self.staleAfter:
+            return False
+        return self.candle is not None if self.hasCandles else self.price != None
+
+    def snapshot(self):
+        # coinbase has no candle channel, its candle is built from trades once a full interval was seen
+        with self.lock:
+            candle = self.candle.copy() if self.candle is not None else self.trades.candle()
+            return candle, self.price
+
+    def _setCandle(self, rows):
+        # rows are in the exchange's REST format, only keep the newest
+        candles = api.normalizeCandles(self.ex, rows)
+        if candles is None or len(candles) == 0: return False
+        newest = candles[np.argmax(candles["t"])]
+        if self.candle is not None and newest["t"] < self.candle[0]["t"]:
+            return False
+        self.candle = np.array([newest], dtype=api.CANDLE_DTYPE)
+        return True
+
+    def _trade(self, t, price, qty, isBuy, tid=None):
+        self.price = price
+        self.trades.add(t, price, qty, isBuy, tid)
+        if self.candle is None: return True
+        c = self.candle[0]
+        if t >= c["t"] + self.gran:
+            # first trade of a new interval, start the candle before the kline channel catches up
+            start = c["t"] + self.gran * int((t - c["t"]) / self.gran)
+            self.candle = api.flatCandle(start, price)
+            if not np.isnan(c["buy"]): self.candle["buy"] = 0
+        elif t >= c["t"]:
+            c["h"] = max(c["h"], price)
+            c["l"] = min(c["l"], price)
+            c["c"] = price
+        return True
+
+    # ----- Exchange specific ----- #
+    def _subscriptions(self):
+        if self.ex == "bitfinex":
+            tint = self.tint
+            if tint == "1d": tint = "1D"
+            elif tint == "1w": tint = "7D"
+            return [{"event":"subscribe", "channel":"candles", "key":"trade:%s:t%sUSD" % (tint, self.coin)},
+                    {"event":"subscribe", "channel":"trades", "symbol":"t%sUSD" % self.coin}]
+        elif self.ex == "coinbasepro":
+            return [{"type":"subscribe", "product_ids":["%s-USD" % self.coin], "channels":["ticker", "matches", "heartbeat"]}]
+        elif self.ex == "gemini":
+            return [{"type":"subscribe", "subscriptions":[{"name":"candles_%s" % self.tint, "symbols":["%sUSD" % self.coin]},
+                                                          {"name":"l2", "symbols":["%sUSD" % self.coin]}]}]
+        elif self.ex == "okex":
+            return [{"op":"subscribe", "args":["spot/candle%ds:%s-USDT" % (self.gran, self.coin),
+                                               "spot/trade:%s-USDT" % self.coin]}]
+        return [] # binance subscribes through the url
+
+    def _parse(self, data):
+        # returns True if the candle or price changed
+        if self.ex == "binance":
+            data = data.get("data", data)
+            if data.get("e") == "kline":
+                k = data["k"]
+                # same columns as the REST klines (taker buy volume is column 9)
+                return self._setCandle([[k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], 0]])
+            elif data.get("e") == "aggTrade":
+                # m: buyer was the maker
+                return self._trade(data["T"] / 1000, float(data["p"]), float(data["q"]), not data["m"], data["a"])
+
+        elif self.ex == "bitfinex":
+            if isinstance(data, dict):
+                if data.get("event") == "subscribed":
+                    self.channels[data["chanId"]] = data["channel"]
+                return False
+            chan = self.channels.get(data[0])
+            if data[1] == "hb": return False
+            if chan == "candles":
+                # snapshot is a list of candles, updates are a single candle
+                rows = data[1] if isinstance(data[1][0], list) else [data[1]]
+                return self._setCandle(rows)
+            elif chan == "trades" and data[1] == "te":
+                trade = data[2] # [id, ms, amount (negative for sells), price]
+                return self._trade(trade[1] / 1000, float(trade[3]), abs(trade[2]), trade[2] > 0, trade[0])
+
+        elif self.ex == "coinbasepro":
+            if data.get("type") == "ticker":
+                self.price = float(data["price"])
+                return True
+            elif data.get("type") == "match":
+                t = np.datetime64(data["time"].rstrip("Z")).astype("datetime64[ms]").astype(np.int64) / 1000
+                # side is the maker's side
+                return self._trade(t, float(data["price"]), float(data["size"]), data["side"] == "sell", data["trade_id"])
+
+        elif self.ex == "gemini":
+            if data.get("type", "").startswith("candles_"):
+                return self._setCandle(data["changes"])
+            elif data.get("type") == "trade":
+                return self._trade(data["timestamp"] / 1000, float(data["price"]), float(data["quantity"]),
+                                   data["side"] == "buy", data.get("event_id"))
+
+        elif self.ex == "okex":
+            table = data.get("table", "")
+            if table.startswith("spot/candle"):
+                return self._setCandle([d["candle"] for d in data["data"]])
+            elif table == "spot/trade":
+                for trade in data["data"]:
+                    t = np.datetime64(trade["timestamp"].rstrip("Z")).astype("datetime64[ms]").astype(np.int64) / 1000
+                    self._trade(t, float(trade["price"]), float(trade["size"]), trade["side"] == "buy", int(trade["trade_id"]))
+                return len(data["data"]) > 0
+        return False
+
+def startStreams(exchanges, tint, COIN="BTC", notify=None):
+    # returns {exchange: ExchangeStream} (empty if websocket-client isn't installed)
+    if not available():
+        print("WARNING: websocket-client is not installed, using REST polling only")
+        return {}
+    streams = {}
+    for ex in exchanges:
+        if ex not in STREAM_URLS: continue
+        # exchanges that don't have the interval stream a shorter one that gets resampled
+        base = api.baseInterval(ex, tint)
+        if base == None: continue
+        streams[ex] = ExchangeStream(ex, base, COIN, notify=notify, tradeGran=api.granFromInterv(tint))
+        streams[ex].start()
+    return streams
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the tracker's modules import each other by name from the LiveBtcTracker folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")
@@ -0,0 +1,46 @@
+import numpy as np
+
+import BTC_API as api
+from CandleCache import CandleCache
+
+NOW = 1700000000 - 1700000000 % 60
+
+def candles(times):
+    # candles (new->old) at the given timestamps
+    ret = api.emptyCandles(len(times))
+    ret["t"] = times
+    ret["o"] = ret["h"] = ret["l"] = ret["c"] = 100
+    ret["v"] = 1
+    return ret
+
+def fetchLog(monkeypatch):
+    # records how many candles each request asks for and returns that many consecutive ones
+    calls = []
+    def getCandle(ex, tint, COIN="BTC", lim=1, start=None, end=None, cache=None):
+        calls.append(lim)
+        return candles(NOW - 60*np.arange(lim))
+    monkeypatch.setattr(api, "getCandle", getCandle)
+    monkeypatch.setattr(api.time, "time", lambda: NOW + 30)
+    return calls
+
+def test_cachedHistoryOnlyFetchesDelta(tmp_path, monkeypatch):
+    cache = CandleCache(str(tmp_path / "candles.db"))
+    cache.save("bitfinex", "BTC", "1m", candles(NOW - 60 - 60*np.arange(100)))
+    calls = fetchLog(monkeypatch)
+
+    ret = api._getCandleCached("bitfinex", "1m", "BTC", 100, cache)
+    assert calls == [3]
+    assert len(ret) == 100
+    assert (np.diff(ret["t"]) == -60).all()
+
+def test_gappedCacheFetchesFullHistory(tmp_path, monkeypatch):
+    # an earlier run kept 50 old candles, then a later one saved 50 newer ones with a gap in between
+    cache = CandleCache(str(tmp_path / "candles.db"))
+    cache.save("bitfinex", "BTC", "1m", candles(NOW - 60 - 60*np.arange(50)))
+    cache.save("bitfinex", "BTC", "1m", candles(NOW - 60*200 - 60*np.arange(50)))
+    calls = fetchLog(monkeypatch)
+
+    ret = api._getCandleCached("bitfinex", "1m", "BTC", 100, cache)
+    assert calls == [100]
+    assert len(ret) == 100
+    assert (np.diff(ret["t"]) == -60).all()
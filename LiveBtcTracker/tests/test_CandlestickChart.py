@@ -0,0 +1,62 @@
+import numpy as np
+
+import BTC_API as api
+from CandlestickChart import CandlestickChart
+from Configuration import DefaultConfig
+
+GRAN = 60
+NOW = 1700000000 - 1700000000 % GRAN
+EXCHANGES = ["binance", "okex", "bitfinex"]
+
+def history(n, price, down=()):
+    # n candles (new->old) ending with the current interval, without the intervals in down
+    # (down: how many intervals before the current one)
+    k = np.array([i for i in range(n) if i not in down])
+    ret = api.emptyCandles(len(k))
+    ret["t"] = NOW - GRAN*k
+    ret["o"] = price + k
+    ret["c"] = price + k + 0.5
+    ret["h"] = price + k + 2
+    ret["l"] = price + k - 1
+    ret["v"] = 1
+    return ret
+
+def makeChart(data, histCnt, consolidation="mean"):
+    conf = dict(DefaultConfig.params)
+    conf.update({"indicators":["MACD", "RSI", "OBV"], "timeFrame":"1m", "enableIdle":False,
+                 "showVolBreakdown":True, "consolidation":consolidation, "showFib":False, "showBBands":True,
+                 "legend":EXCHANGES})
+    chart = CandlestickChart("BTC", conf)
+    chart.loadHistory(data, histCnt)
+    return chart
+
+def test_backfillWhenEveryExchangeWasDown():
+    # every exchange was down 5 to 9 intervals ago, then binance is readmitted with the candles it missed
+    down = range(5, 10)
+    data = [history(300, 100, down), history(300, 100, down), history(300, 100, down)]
+    chart = makeChart(data, 200)
+    idx = [chart.currInt - k for k in down]
+    assert not chart.exValid[idx[0]].any()
+
+    missed = history(300, 100)[list(down)]
+    chart.backfillExchange(0, list(zip(idx, missed)))
+
+    for i, row in zip(idx, missed):
+        assert chart.exValid[i][0]
+        assert list(chart.priceChart.ohlc[i][1:5]) == [row["o"], row["h"], row["l"], row["c"]]
+        assert chart.volumeChart.getVolBar(i)[0] == row["v"]
+
+def test_backfillIsConsolidatedLikeTheRestOfTheChart():
+    # binance was down and comes back with an outlier, the median of the three exchanges is the middle one
+    down = range(5, 10)
+    data = [history(300, 100, down), history(300, 100), history(300, 110)]
+    chart = makeChart(data, 200, consolidation="median")
+    idx = [chart.currInt - k for k in down]
+
+    missed = history(300, 200)[list(down)]
+    chart.backfillExchange(0, list(zip(idx, missed)))
+
+    middle = data[2][list(down)]
+    for i, row in zip(idx, middle):
+        assert chart.exValid[i].all()
+        assert list(chart.priceChart.ohlc[i][1:5]) == [row["o"], row["h"], row["l"], row["c"]]
@@ -0,0 +1,26 @@
+import numpy as np
+
+import BTC_API as api
+import DataFeed
+
+def test_unchangedCandleWithUnknownBuyVolumeSlowsPolling():
+    # only binance has taker buy volume, every other exchange's candles have NaN there
+    candle = api.emptyCandles(1)
+    candle[0] = (1700000000, 100, 101, 99, 100.5, 3, np.nan)
+    sched = DataFeed.PollScheduler(["okex"], 60)
+    first = sched._period("okex", 0)
+    for now in range(21):
+        sched.observe("okex", tuple(candle[0]), now)
+    assert sched.wasted["okex"] == 20
+    assert sched.changeInterval["okex"] > 1
+    assert sched._period("okex", 20) > first
+
+def test_changedCandleIsObserved():
+    candle = api.emptyCandles(1)
+    candle[0] = (1700000000, 100, 101, 99, 100.5, 3, np.nan)
+    sched = DataFeed.PollScheduler(["okex"], 60)
+    sched.observe("okex", tuple(candle[0]), 0)
+    candle[0]["c"] = 100.7
+    sched.observe("okex", tuple(candle[0]), 1)
+    assert sched.wasted["okex"] == 0
+    assert sched.lastChange["okex"] == 1